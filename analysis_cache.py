@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from metrics import inc
+
+# --- CACHE CONFIG ---
+# Point LEXISAFE_CACHE_DIR at a shared volume to share results between replicas,
+# or set LEXISAFE_CACHE=off to keep everything in memory as before.
+CACHE_DIR = os.getenv("LEXISAFE_CACHE_DIR", ".lexisafe_cache")
+CACHE_ENABLED = os.getenv("LEXISAFE_CACHE", "on").lower() not in ("0", "off", "false", "no")
+MAX_BYTES = int(float(os.getenv("LEXISAFE_CACHE_MAX_MB", "512")) * 1024 * 1024)
+TTL_SECONDS = int(float(os.getenv("LEXISAFE_CACHE_TTL_DAYS", "30")) * 86400)
+
+def hash_bytes(data):
+    """
+    SHA-256 of the uploaded file's bytes, used as the document's identity.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+class AnalysisCache:
+    """
+    Content-addressed on-disk cache for extracted text and parsed risks.
+    Text is keyed by document hash and compaction version; risks by document
+    hash, prompt version and model, so changing the prompt or model invalidates
+    old analyses without touching extraction.
+    Clause findings are keyed by normalized clause hash and shared by every document.
+    """
+
+    def __init__(self, path=None, max_bytes=MAX_BYTES, ttl_seconds=TTL_SECONDS):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "analysis.sqlite3")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            inc("cache_requests_total", cache="analysis", kind=key.split(":")[0], result="miss" if row is None else "hit")
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def _put(self, key, value):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now)
+            )
+            self._evict(conn, now)
+
+    def _get_many(self, keys):
+        """
+        Values for the keys that are present, fetched in a few queries rather than one per key.
+        """
+        now = time.time()
+        found = {}
+        with self._lock, self._connect() as conn:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                for key, value, created in conn.execute(
+                        f"SELECT key, value, created FROM entries WHERE key IN ({marks})", part):
+                    if not (self.ttl_seconds and now - created > self.ttl_seconds):
+                        found[key] = value
+            conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?", [(now, k) for k in found])
+        if keys:
+            kind = keys[0].split(":")[0]
+            inc("cache_requests_total", len(found), cache="analysis", kind=kind, result="hit")
+            inc("cache_requests_total", len(keys) - len(found), cache="analysis", kind=kind, result="miss")
+        return found
+
+    def _put_many(self, items):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                [(key, value, len(value.encode("utf-8")), now, now) for key, value in items]
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl_seconds,))
+        if not self.max_bytes:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Least recently used entries go first
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def get_text(self, doc_hash, version):
+        return self._get(f"text:{doc_hash}:{version}")
+
+    def put_text(self, doc_hash, version, text):
+        self._put(f"text:{doc_hash}:{version}", text)
+
+    def get_pages(self, doc_hash, version):
+        value = self._get(f"pages:{doc_hash}:{version}")
+        return json.loads(value) if value is not None else None
+
+    def put_pages(self, doc_hash, version, offsets):
+        self._put(f"pages:{doc_hash}:{version}", json.dumps(offsets))
+
+    def get_risks(self, doc_hash, prompt_version, model):
+        value = self._get(f"risks:{doc_hash}:{prompt_version}:{model}")
+        return json.loads(value) if value is not None else None
+
+    def put_risks(self, doc_hash, prompt_version, model, risks):
+        self._put(f"risks:{doc_hash}:{prompt_version}:{model}", json.dumps(risks))
+
+    def get_clauses(self, clause_hashes, prompt_version, model):
+        """
+        {clause_hash: raw findings} for the clauses already analyzed, in any document.
+        """
+        prefix = f"clause:{prompt_version}:{model}:"
+        found = self._get_many([prefix + h for h in clause_hashes])
+        return {key[len(prefix):]: value for key, value in found.items()}
+
+    def put_clauses(self, findings, prompt_version, model):
+        prefix = f"clause:{prompt_version}:{model}:"
+        self._put_many([(prefix + h, raw) for h, raw in findings.items()])
+
+class _NullCache:
+    """
+    Stand-in used when caching is switched off: every lookup is a miss.
+    """
+
+    def get_text(self, doc_hash, version): return None
+    def put_text(self, doc_hash, version, text): pass
+    def get_pages(self, doc_hash, version): return None
+    def put_pages(self, doc_hash, version, offsets): pass
+    def get_risks(self, doc_hash, prompt_version, model): return None
+    def put_risks(self, doc_hash, prompt_version, model, risks): pass
+    def get_clauses(self, clause_hashes, prompt_version, model): return {}
+    def put_clauses(self, findings, prompt_version, model): pass
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """
+    Returns the process-wide cache, opening it on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache() if CACHE_ENABLED else _NullCache()
+        return _cache
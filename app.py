@@ -1,9 +1,28 @@
 import streamlit as st
+import hashlib
+import json
+import os
+import threading
 import time
-from utils import get_pdf_text, analyze_clause_with_llm
-from chatbot import get_chat_response
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils import get_pdf_text_with_pages, stream_contract_analysis, cached_clause_findings, analysis_version, MODEL_NAME
+from risk_parser import RiskStreamParser
+from analysis_cache import get_cache, hash_bytes
+from retriever import ContractIndex
+from metrics import start_http_server, write_prometheus
+from chatbot import stream_chat_response, summarize_history, summarize_risks, warm_up
+from memory import ConversationMemory
 from report_generator import create_pdf_report
-from email_generator import generate_email
+from email_generator import stream_email
+from versions import version_snapshot, version_changes
+from speculation import StreamJob
+from job_queue import JOBS_ENABLED, JOB_WORKERS, get_job_queue, store_upload, start_workers
+from doc_store import get_doc_store, deep_sizeof, report_session
+from compaction import compaction_version
+from findings_index import get_findings_index
+from dashboard import build_view_model, render_html, HEIGHT as DASHBOARD_HEIGHT
 
 # ==========================================
 # 1. PAGE CONFIGURATION
@@ -169,25 +188,288 @@ st.markdown("""
 # ==========================================
 # 3. HELPER FUNCTIONS
 # ==========================================
-@st.cache_data(show_spinner=False)
-def get_pdf_text_cached(f): return get_pdf_text(f)
+METRIC_STYLES = {"High": ("metric-red", "num-red", "Critical Risks"), "Medium": ("metric-yellow", "num-yellow", "Warnings"), "Low": ("metric-green", "num-green", "Safe Clauses")}
+BORDERS = {"High": "high-border", "Medium": "medium-border", "Low": "low-border"}
 
-@st.cache_data(show_spinner=False)
-def analyze_clause_cached(t): return analyze_clause_with_llm(t)
+def metric_html(risk_type, n):
+    box_cls, num_cls, label = METRIC_STYLES[risk_type]
+    return f'<div class="metric-box {box_cls}"><div class="metric-number {num_cls}">{n}</div><div class="metric-label">{label}</div></div>'
+
+def card_html(item, border_cls):
+    return f'<div class="risk-card {border_cls}"><div class="card-title">{item["title"]}</div><div style="color: #C9D1D9; font-size: 0.95rem; margin-bottom: 10px;">{item["expl"]}</div><div class="card-fix">💡 <b>Fix:</b> {item["fix"]}</div></div>'
+
+# Sessions hold only the document's SHA-256. Text and risks live once per document in
+# the document store; the disk cache still lets results survive restarts and deploys
+EMPTY_RISKS = {"High": [], "Medium": [], "Low": []}
+
+def document_text(doc_hash, f):
+    """
+    The document's extracted text. Its page offsets are kept next to it in both
+    caches, so however the text is found the dashboard can still place findings on pages.
+    """
+    store, version = get_doc_store(), compaction_version()
+    text = store.get_text(doc_hash, version)
+    if text is not None and store.get_pages(doc_hash, version) is not None: return text
+    cache = get_cache()
+    text, offsets = cache.get_text(doc_hash, version), cache.get_pages(doc_hash, version)
+    if text is None or offsets is None:
+        text, offsets = get_pdf_text_with_pages(f)
+        if text.startswith("Error reading PDF"): return text
+        cache.put_text(doc_hash, version, text)
+        cache.put_pages(doc_hash, version, offsets)
+    store.put_text(doc_hash, version, text)
+    store.put_pages(doc_hash, version, offsets)
+    return text
+
+def document_pages(doc_hash):
+    version = compaction_version()
+    return get_doc_store().get_pages(doc_hash, version) or get_cache().get_pages(doc_hash, version)
+
+def current_risks():
+    """
+    The current document's risks, shared with every session that has it open; don't mutate.
+    """
+    doc_hash = st.session_state.doc_hash
+    if not doc_hash: return EMPTY_RISKS
+    store = get_doc_store()
+    risks = store.get(doc_hash, "risks")
+    if risks is None:
+        # Pruned from the store while the session was idle
+        risks = get_cache().get_risks(doc_hash, analysis_version(), MODEL_NAME)
+        if risks is None: return EMPTY_RISKS
+        store.put(doc_hash, "risks", risks)
+    return risks
+
+def analyze_document_live(f, doc_hash, base=None):
+    """
+    Streams the analysis and fills the metric boxes and tabs as each record completes.
+    With base (the snapshot of a previous version) findings of unchanged clauses are
+    carried over and only changed or inserted clauses are analyzed.
+    Returns (risks, parse_report, snapshot); cache hits return at once.
+    """
+    cache = get_cache()
+    risks = cache.get_risks(doc_hash, analysis_version(), MODEL_NAME)
+    if risks is not None:
+        text = document_text(doc_hash, f)
+        return risks, {"malformed": 0, "errors": []}, version_snapshot(f.name, text, risks, cached_clause_findings(text))
+
+    with st.spinner("🧠 Scanning document layers..."):
+        text = document_text(doc_hash, f)
+    status = st.empty()
+    cols = st.columns(3)
+    boxes = {k: c.empty() for k, c in zip(("High", "Medium", "Low"), cols)}
+    for k, box in boxes.items(): box.markdown(metric_html(k, 0), unsafe_allow_html=True)
+    st.markdown("---")
+    tabs = dict(zip(("High", "Medium", "Low"), st.tabs(["🔥 Critical", "⚠️ Warnings", "✅ Safe"])))
+
+    parser = RiskStreamParser()
+    def show(found):
+        for bucket, item in found:
+            boxes[bucket].markdown(metric_html(bucket, len(parser.risks[bucket])), unsafe_allow_html=True)
+            with tabs[bucket]: st.markdown(card_html(item, BORDERS[bucket]), unsafe_allow_html=True)
+        n = sum(len(v) for v in parser.risks.values())
+        status.caption(f"🧠 Analyzing... {n} findings so far")
+
+    status.caption("🧠 Analyzing..." if base is None else f"🧠 Analyzing changes since {base['name']}...")
+    findings = {}
+    for piece in stream_contract_analysis(text, carried=base and base["findings"], findings=findings): show(parser.feed(piece))
+    show(parser.close())
+
+    report = {"malformed": len(parser.malformed), "errors": parser.errors}
+    if not parser.errors: cache.put_risks(doc_hash, analysis_version(), MODEL_NAME, parser.risks)
+    export_metrics()
+    return parser.risks, report, version_snapshot(f.name, text, parser.risks, findings)
+
+# Earlier analyses kept per session so a redline can be linked to its previous version.
+# The session keeps hash -> file name; snapshots are in the document store
+MAX_VERSIONS = 8
+MAX_MESSAGES = 40   # chat bubbles kept for display; the model sees chat_memory
+
+def remember_version(doc_hash, snapshot):
+    get_doc_store().put(doc_hash, "snapshot", snapshot)
+    versions = st.session_state.versions
+    versions[doc_hash] = snapshot["name"]
+    versions.move_to_end(doc_hash)
+    while len(versions) > MAX_VERSIONS: versions.popitem(last=False)
+
+# The findings list is rendered once per analysis into a single HTML block (see
+# dashboard.py) and stored with the document, so reruns only re-send it
+def build_dashboard(doc_hash, risks, text=None, findings=None):
+    if text is not None and not findings:
+        # Risks from the document cache: the clause cache still has each clause's findings
+        findings = cached_clause_findings(text)
+    view = build_view_model(risks, text, document_pages(doc_hash), findings)
+    dashboard = {"counts": view["counts"], "html": render_html(view)}
+    get_doc_store().put(doc_hash, "dashboard", dashboard)
+    return dashboard
+
+def current_dashboard():
+    doc_hash = st.session_state.doc_hash
+    store = get_doc_store()
+    return store.get(doc_hash, "dashboard") or build_dashboard(
+        doc_hash, current_risks(), store.get_text(doc_hash, compaction_version()))
+
+def version_base(doc_hash):
+    return get_doc_store().get(doc_hash, "snapshot") if doc_hash in st.session_state.versions else None
+
+def changes_markdown(changes):
+    c = changes["clauses"]
+    lines = [f"**Clauses:** {c['unchanged']} unchanged, {c['changed']} changed, {c['inserted']} inserted, {c['removed']} removed"]
+    lines += [f"- 🆕 **Added** ({bucket}): {item['title']}" for bucket, item in changes["added"]]
+    lines += [f"- ✅ **Resolved** ({bucket}): {item['title']}" for bucket, item in changes["resolved"]]
+    lines += [f"- 🔁 **Changed** ({old} → {new}): {item['title']}" for old, new, item in changes["changed"]]
+    if len(lines) == 1: lines.append("No findings were added, resolved or changed.")
+    return "\n".join(lines)
+
+# Work started ahead of the user (report PDFs, email drafts, chat indexes) runs on a
+# process-wide pool. Jobs are keyed by their inputs and kept in an LRU, so reruns
+# attach to the same job and a change of inputs simply starts a new one
+BACKGROUND_JOBS = 64
+
+@st.cache_resource(show_spinner=False)
+def background():
+    return {"pool": ThreadPoolExecutor(max_workers=4), "jobs": OrderedDict(), "lock": threading.Lock()}
+
+def background_job(key, start):
+    """
+    The job stored under key, created with start(pool) the first time it is asked for.
+    start runs under the lock shared by every session, so it should only submit work.
+    """
+    b = background()
+    with b["lock"]:
+        job = b["jobs"].get(key)
+        if job is None:
+            job = b["jobs"][key] = start(b["pool"])
+            while len(b["jobs"]) > BACKGROUND_JOBS: b["jobs"].popitem(last=False)
+        else:
+            b["jobs"].move_to_end(key)
+    return job
+
+def forget_job(key):
+    b = background()
+    with b["lock"]: b["jobs"].pop(key, None)
+
+def risks_key(filename, risks):
+    return hashlib.sha256(json.dumps([filename, risks], sort_keys=True).encode("utf-8")).hexdigest()
+
+# Report PDFs are built once per (filename, risks) instead of re-rendering on every rerun
+def report_future(key, filename, risks):
+    return background_job(f"report:{key}", lambda pool: pool.submit(create_pdf_report, filename, risks))
+
+def start_report(filename, risks):
+    st.session_state.report_key = risks_key(filename, risks)
+    report_future(st.session_state.report_key, filename, risks)
+
+# One retrieval index per document hash, built from the stored text. The text is
+# fetched before background_job: start() runs under the process-wide job lock, and
+# a cold document_text extracts the whole PDF
+def contract_index_future(doc_hash, f):
+    def build(text):
+        try: warm_up()
+        except Exception: pass  # the chat reports client errors itself on the first question
+        return ContractIndex(text)
+    text = document_text(doc_hash, f)
+    return background_job(f"index:{doc_hash}", lambda pool: pool.submit(build, text))
+
+# The email draft for (filename, risks), streamed into a StreamJob that "Draft Now" attaches to
+def email_job(filename, risks):
+    return background_job(f"email:{risks_key(filename, risks)}", lambda pool: StreamJob(pool, lambda: stream_email(filename, risks)))
+
+def start_speculation(f, risks):
+    """
+    Once risks are parsed the user almost always drafts the email or opens the chat
+    next, so both are started right away instead of on the click.
+    """
+    email_job(f.name, risks)
+    contract_index_future(st.session_state.doc_hash, f)
+
+# Metrics export: LEXISAFE_METRICS_PORT serves /metrics, LEXISAFE_METRICS_FILE is rewritten after each analysis
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    port = os.getenv("LEXISAFE_METRICS_PORT")
+    return start_http_server(int(port)) if port else None
+
+def export_metrics():
+    path = os.getenv("LEXISAFE_METRICS_FILE")
+    if path: write_prometheus(path)
+
+start_metrics_server()
+
+# With LEXISAFE_JOBS=on analyses run as queued jobs in worker processes; the page
+# submits and polls, and the job id in the URL lets a reloaded page pick it up again
+@st.cache_resource(show_spinner=False)
+def job_workers():
+    return start_workers(JOB_WORKERS) if JOBS_ENABLED and JOB_WORKERS > 0 else []
+
+job_workers()
+
+def submit_analysis(f, base_hash):
+    base = version_base(base_hash)
+    payload = store_upload(f.name, f.getvalue())
+    payload["carried"] = base["findings"] if base else None
+    st.session_state.job_id = get_job_queue().submit("analyze", payload)
+    st.session_state.job_base = base_hash
+    st.query_params["job"] = st.session_state.job_id
+
+def finish_analysis(f, risks, parse_report, snapshot, base):
+    doc_hash = st.session_state.doc_hash
+    get_doc_store().put(doc_hash, "risks", risks)
+    st.session_state.parse_report = parse_report
+    remember_version(doc_hash, snapshot)
+    build_dashboard(doc_hash, risks, document_text(doc_hash, f), snapshot["findings"])
+    st.session_state.changes = version_changes(base, snapshot) if base else None
+    start_report(f.name, risks)
+    start_speculation(f, risks)
+    st.session_state.analysis_done = True
+
+def collect_job(f):
+    """
+    Moves a finished analysis job into the session; returns the job while it is still pending.
+    """
+    job = get_job_queue().get(st.session_state.job_id)
+    if job is not None and job["status"] in ("queued", "running"): return job
+    st.session_state.job_id = None
+    st.query_params.pop("job", None)
+    if job is None: return None
+    if job["status"] == "done":
+        r = job["result"]
+        finish_analysis(f, r["risks"], r["parse_report"], r["snapshot"], version_base(st.session_state.job_base))
+    else:
+        st.session_state.parse_report = {"malformed": 0, "errors": [job["error"]]}
+    return None
+
+@st.fragment(run_every=1.0)
+def job_progress(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None or job["status"] not in ("queued", "running"):
+        st.rerun()
+    st.progress(job["progress"], text=job["message"] or ("⏳ Waiting for a worker..." if job["status"] == "queued" else "🧠 Working..."))
+    partial = (job["result"] or {}).get("risks")
+    if partial:
+        cols = st.columns(3)
+        for k, c in zip(("High", "Medium", "Low"), cols): c.markdown(metric_html(k, len(partial[k])), unsafe_allow_html=True)
 
 def set_modal_chat(): st.session_state.active_modal = "chat"
 def set_modal_email(): st.session_state.active_modal = "email"
+def set_modal_search(): st.session_state.active_modal = "search"
 def close_modals(): st.session_state.active_modal = None
 
 # ==========================================
 # 4. SESSION STATE
 # ==========================================
 if 'last_file' not in st.session_state: st.session_state.last_file = None
-if 'chat_history' not in st.session_state: st.session_state.chat_history = ""
+if 'chat_memory' not in st.session_state: st.session_state.chat_memory = ConversationMemory(summarize_history)
 if 'messages' not in st.session_state: st.session_state.messages = []
 if 'active_modal' not in st.session_state: st.session_state.active_modal = None 
-if 'risks' not in st.session_state: st.session_state.risks = {"High": [], "Medium": [], "Low": []}
+if 'doc_hash' not in st.session_state: st.session_state.doc_hash = None
+if 'session_id' not in st.session_state: st.session_state.session_id = uuid.uuid4().hex
 if 'email_draft' not in st.session_state: st.session_state.email_draft = "" 
+if 'parse_report' not in st.session_state: st.session_state.parse_report = {"malformed": 0, "errors": []}
+if 'report_key' not in st.session_state: st.session_state.report_key = None
+if 'versions' not in st.session_state: st.session_state.versions = OrderedDict()
+if 'changes' not in st.session_state: st.session_state.changes = None
+if 'job_id' not in st.session_state: st.session_state.job_id = st.query_params.get("job") if JOBS_ENABLED else None
+if 'job_base' not in st.session_state: st.session_state.job_base = None
 
 # ==========================================
 # 5. ENHANCED DIALOGS
@@ -195,7 +477,7 @@ if 'email_draft' not in st.session_state: st.session_state.email_draft = ""
 
 # --- A. CHATBOT DIALOG ---
 @st.dialog("💬 LexiSafe Assistant", width="large")
-def open_chat_modal(pdf_text, analysis_summary):
+def open_chat_modal(contract_index, analysis_summary):
     st.markdown("""
         <div class="dialog-header">
             <span style="font-size: 24px;">🤖</span>
@@ -212,12 +494,12 @@ def open_chat_modal(pdf_text, analysis_summary):
         with st.chat_message("user"): st.markdown(prompt)
         
         with st.chat_message("assistant"):
-            with st.spinner("Analyzing contract context..."):
-                reply = get_chat_response(prompt, pdf_text, analysis_summary, st.session_state.chat_history)
-                st.markdown(reply)
+            # Tokens are rendered as they arrive; write_stream returns the full reply
+            reply = st.write_stream(stream_chat_response(prompt, None, analysis_summary, st.session_state.chat_memory.render(), index=contract_index))
         
         st.session_state.messages.append({"role": "assistant", "content": reply})
-        st.session_state.chat_history += f"\nUser: {prompt}\nAI: {reply}"
+        del st.session_state.messages[:-MAX_MESSAGES]
+        st.session_state.chat_memory.add_turn(prompt, reply)
         st.rerun()
 
 # --- B. EMAIL GENERATOR DIALOG ---
@@ -234,11 +516,17 @@ def open_email_modal(filename, risks):
     
     col1, col2 = st.columns([3, 1])
     with col2:
-        if st.button("✨ Draft Now", key="gen_email_btn", use_container_width=True):
-            with st.spinner("Crafting legal response..."):
-                email_content = generate_email(filename, risks)
-                st.session_state.email_draft = email_content
-                st.rerun()
+        draft_clicked = st.button("✨ Draft Now", key="gen_email_btn", use_container_width=True)
+    
+    if draft_clicked:
+        # Attaches to the draft speculated after analysis: instant if it finished, otherwise
+        # the rest streams in. Failed drafts are not reused.
+        job = email_job(filename, risks)
+        if job.done() and (job.failed or job.result().startswith("Error")):
+            forget_job(f"email:{risks_key(filename, risks)}")
+            job = email_job(filename, risks)
+        st.session_state.email_draft = job.result() if job.done() else st.write_stream(job.follow())
+        st.rerun()
     
     if st.session_state.email_draft:
         st.markdown("<div class='email-container'>", unsafe_allow_html=True)
@@ -250,6 +538,38 @@ def open_email_modal(filename, risks):
         st.markdown("</div>", unsafe_allow_html=True)
         st.caption("💡 Pro Tip: Review the draft and copy it to your email client.")
 
+# --- C. PORTFOLIO SEARCH DIALOG ---
+SEARCH_SHOWN = 100   # contracts listed per search; the count covers all of them
+BADGES = {"High": "🔥", "Medium": "⚠️", "Low": "✅"}
+
+@st.dialog("🔎 Portfolio Search", width="large")
+def open_search_modal():
+    st.markdown("""
+        <div class="dialog-header">
+            <span style="font-size: 24px;">🗂️</span>
+            <span class="dialog-title">Search Every Analyzed Contract</span>
+        </div>
+    """, unsafe_allow_html=True)
+
+    index = get_findings_index()
+    stats = index.stats()
+    query = st.text_input("Search findings", placeholder="e.g. uncapped liability OR data sale", label_visibility="collapsed")
+    levels = st.multiselect("Risk level", ["High", "Medium", "Low"], default=["High", "Medium"])
+    st.caption(f"{stats['documents']} contracts and {stats['findings']} findings indexed. Put OR between alternatives.")
+    if not query: return
+
+    docs = index.documents(query, levels, limit=None)
+    if not docs:
+        st.info("No analyzed contract has a matching finding.")
+        return
+    st.markdown(f"**{len(docs)} contract(s)** match" + (f" (first {SEARCH_SHOWN} shown)" if len(docs) > SEARCH_SHOWN else ""))
+    # One markdown block for the whole list rather than an element per finding
+    lines = []
+    for doc in docs[:SEARCH_SHOWN]:
+        lines.append(f"\n**{doc['name']}**\n")
+        lines += [f"- {BADGES[f['risk']]} {f['title']}: {f['expl']}" for f in doc["findings"]]
+    st.markdown("\n".join(lines))
+
 # ==========================================
 # 6. SIDEBAR
 # ==========================================
@@ -258,6 +578,7 @@ with st.sidebar:
     st.markdown("---")
     
     uploaded_file = st.file_uploader("Upload PDF", type="pdf", label_visibility="collapsed")
+    st.button("🔎 &nbsp; Portfolio Search", use_container_width=True, on_click=set_modal_search)
     
     # Tool Kit (Hidden until analysis is done)
     if uploaded_file and st.session_state.get("analysis_done", False):
@@ -267,10 +588,12 @@ with st.sidebar:
             if st.button("💬 &nbsp; AI Chat Assistant", use_container_width=True, on_click=set_modal_chat): pass 
             if st.button("📧 &nbsp; Email Drafter", use_container_width=True, on_click=set_modal_email): pass
             
-            pdf_bytes = create_pdf_report(uploaded_file.name, st.session_state.risks)
+            risks = current_risks()
+            if st.session_state.report_key is None: start_report(uploaded_file.name, risks)
+            report = report_future(st.session_state.report_key, uploaded_file.name, risks)
             st.download_button(
                 label="📄 &nbsp; Export PDF Report",
-                data=pdf_bytes,
+                data=report.result,  # deferred to the click; usually already built in the background
                 file_name="LexiSafe_Report.pdf",
                 mime="application/pdf",
                 use_container_width=True,
@@ -280,14 +603,23 @@ with st.sidebar:
 # ==========================================
 # 7. MAIN LOGIC
 # ==========================================
-if uploaded_file and st.session_state.last_file != uploaded_file.name:
+# file_id changes on every upload, so a redline re-uploaded under the same name is still a new document
+if uploaded_file and st.session_state.last_file != uploaded_file.file_id:
     st.session_state.analysis_done = False
-    st.session_state.risks = {"High": [], "Medium": [], "Low": []}
+    st.session_state.doc_hash = hash_bytes(uploaded_file.getvalue())
+    st.session_state.parse_report = {"malformed": 0, "errors": []}
+    st.session_state.report_key = None
     st.session_state.messages = []
-    st.session_state.chat_history = ""
+    st.session_state.chat_memory = ConversationMemory(summarize_history)
     st.session_state.email_draft = ""
     st.session_state.active_modal = None 
-    st.session_state.last_file = uploaded_file.name
+    st.session_state.changes = None
+    # A job submitted before a reload carries on if the same document is uploaded again
+    job = get_job_queue().get(st.session_state.job_id) if st.session_state.job_id else None
+    if job is None or job["payload"]["sha256"] != st.session_state.doc_hash:
+        st.session_state.job_id = None
+        st.query_params.pop("job", None)
+    st.session_state.last_file = uploaded_file.file_id
     st.rerun()
 
 if not uploaded_file:
@@ -304,54 +636,65 @@ if not uploaded_file:
     with c2: st.markdown('<div class="feature-card"><div class="feature-icon">🔍</div><div class="feature-title">Risk Detection</div><div class="feature-desc">AI finds hidden liabilities.</div></div>', unsafe_allow_html=True)
     with c3: st.markdown('<div class="feature-card"><div class="feature-icon">🛡️</div><div class="feature-title">Legal Shield</div><div class="feature-desc">Smart fixes for safer terms.</div></div>', unsafe_allow_html=True)
     st.markdown("<br><br>", unsafe_allow_html=True)
-    st.info("👈 **Upload your PDF from the sidebar to begin.**")
+    job = get_job_queue().get(st.session_state.job_id) if st.session_state.job_id else None
+    if job:
+        st.info(f"⏳ The analysis of `{job['payload']['name']}` is {job['status']} ({job['progress']:.0%}). Upload the same file again to open the results.")
+    else:
+        st.info("👈 **Upload your PDF from the sidebar to begin.**")
 
 else:
     st.markdown(f"### 📑 Analysis Report: `{uploaded_file.name}`")
     
-    if not st.session_state.analysis_done:
+    if not st.session_state.analysis_done and st.session_state.job_id:
+        if collect_job(uploaded_file): job_progress(st.session_state.job_id)
+        else: st.rerun()
+
+    elif not st.session_state.analysis_done:
         st.markdown("<br>", unsafe_allow_html=True)
+        report = st.session_state.parse_report
+        if report["errors"]: st.error(f"⚠️ The analysis failed: {report['errors'][0]}")
+        doc_hash = st.session_state.doc_hash
+        earlier = [h for h in reversed(st.session_state.versions) if h != doc_hash]
+        base_hash = None
+        if earlier:
+            base_hash = st.selectbox(
+                "🔁 Previous version of this contract",
+                [None] + earlier, index=1,
+                format_func=lambda h: "None (full analysis)" if h is None else st.session_state.versions[h],
+                help="Findings for unchanged clauses are carried over; only the redlined parts are re-analyzed.")
         if st.button("🚀 RUN RISK ASSESSMENT"):
-            with st.spinner("🧠 Scanning document layers..."):
-                text = get_pdf_text_cached(uploaded_file)
-                raw = analyze_clause_cached(text[:25000])
-                clauses = raw.split("###")
-                st.session_state.risks = {"High": [], "Medium": [], "Low": []}
-                for c in clauses:
-                    if "|" in c:
-                        try:
-                            p = c.split("|")
-                            if len(p) >= 3:
-                                d = {"title": p[0].strip(), "risk": p[1].strip(), "expl": p[2].strip(), "fix": p[3].strip() if len(p)>3 else ""}
-                                if "High" in d["risk"]: st.session_state.risks["High"].append(d)
-                                elif "Medium" in d["risk"]: st.session_state.risks["Medium"].append(d)
-                                else: st.session_state.risks["Low"].append(d)
-                        except: continue
-                st.session_state.analysis_done = True
-                st.rerun()
+            if JOBS_ENABLED:
+                submit_analysis(uploaded_file, base_hash)
+            else:
+                base = version_base(base_hash)
+                risks, parse_report, snapshot = analyze_document_live(uploaded_file, doc_hash, base)
+                # Job workers index their own results
+                get_findings_index().add(doc_hash, uploaded_file.name, risks)
+                finish_analysis(uploaded_file, risks, parse_report, snapshot, base)
+            st.rerun()
 
     if st.session_state.analysis_done:
         st.markdown("<br>", unsafe_allow_html=True)
+        dashboard = current_dashboard()
         
         # Metrics with Hover Animation
         c1, c2, c3 = st.columns(3)
-        h, m, l = len(st.session_state.risks["High"]), len(st.session_state.risks["Medium"]), len(st.session_state.risks["Low"])
-        with c1: st.markdown(f'<div class="metric-box metric-red"><div class="metric-number num-red">{h}</div><div class="metric-label">Critical Risks</div></div>', unsafe_allow_html=True)
-        with c2: st.markdown(f'<div class="metric-box metric-yellow"><div class="metric-number num-yellow">{m}</div><div class="metric-label">Warnings</div></div>', unsafe_allow_html=True)
-        with c3: st.markdown(f'<div class="metric-box metric-green"><div class="metric-number num-green">{l}</div><div class="metric-label">Safe Clauses</div></div>', unsafe_allow_html=True)
+        with c1: st.markdown(metric_html("High", dashboard["counts"]["High"]), unsafe_allow_html=True)
+        with c2: st.markdown(metric_html("Medium", dashboard["counts"]["Medium"]), unsafe_allow_html=True)
+        with c3: st.markdown(metric_html("Low", dashboard["counts"]["Low"]), unsafe_allow_html=True)
+        
+        report = st.session_state.parse_report
+        if report["errors"]: st.warning(f"⚠️ Part of the document could not be analyzed: {report['errors'][0]}")
+        if report["malformed"]: st.caption(f"⚠️ {report['malformed']} malformed record(s) in the AI response were skipped.")
+        
+        if st.session_state.changes:
+            with st.expander(f"🔁 Changes since `{st.session_state.changes['base']}`", expanded=True):
+                st.markdown(changes_markdown(st.session_state.changes))
         
         st.markdown("---")
         
-        # Risk Lists
-        t1, t2, t3 = st.tabs(["🔥 Critical", "⚠️ Warnings", "✅ Safe"])
-        def render_list(risk_type, border_cls):
-            items = st.session_state.risks[risk_type]
-            if not items: st.markdown(f"<div style='text-align:center; padding:20px; color:#666;'>No {risk_type} risks found.</div>", unsafe_allow_html=True); return
-            for item in items: st.markdown(f'<div class="risk-card {border_cls}"><div class="card-title">{item["title"]}</div><div style="color: #C9D1D9; font-size: 0.95rem; margin-bottom: 10px;">{item["expl"]}</div><div class="card-fix">💡 <b>Fix:</b> {item["fix"]}</div></div>', unsafe_allow_html=True)
-
-        with t1: render_list("High", "high-border")
-        with t2: render_list("Medium", "medium-border")
-        with t3: render_list("Low", "low-border")
+        # Risk List: search, level/page filters and paging run in the browser
+        st.iframe(dashboard["html"], height=DASHBOARD_HEIGHT)
         
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("🔄 Check Another File"):
@@ -360,14 +703,20 @@ else:
 
 # --- TRIGGER: MODALS ---
 if st.session_state.active_modal == 'chat':
-    text_context = get_pdf_text_cached(uploaded_file)
-    risk_summary = f"High: {len(st.session_state.risks['High'])}, Med: {len(st.session_state.risks['Medium'])}."
-    if st.session_state.risks['High']:
-        risk_summary += "Critical:\n" + "\n".join([f"- {r['title']}: {r['expl']}" for r in st.session_state.risks['High']])
-    open_chat_modal(text_context, risk_summary)
+    contract_index = contract_index_future(st.session_state.doc_hash, uploaded_file).result()
+    risks = current_risks()
+    open_chat_modal(contract_index, summarize_risks(risks))
 
 elif st.session_state.active_modal == 'email':
-    open_email_modal(uploaded_file.name, st.session_state.risks)
+    open_email_modal(uploaded_file.name, current_risks())
+
+elif st.session_state.active_modal == 'search':
+    open_search_modal()
+
+# --- SESSION MEMORY ---
+session_bytes = deep_sizeof(st.session_state.to_dict())
+report_session(st.session_state.session_id, session_bytes)
+st.sidebar.caption(f"Session memory: {session_bytes / 1024:.0f} KB")
 
 # --- FOOTER ---
 st.markdown("""
@@ -0,0 +1,161 @@
+"""
+Headless batch review of a directory of contracts.
+
+    python batch.py contracts/ --output results.jsonl --reports-dir reports/ --workers 8 --max-inflight 16
+
+Each PDF produces one JSON line in the output file. Re-running with the same
+output file skips contracts already analyzed successfully, so an interrupted
+run can simply be started again.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils import get_pdf_text, analyze_contract, set_inflight_limit, analysis_version, MODEL_NAME
+from compaction import compaction_version
+from analysis_cache import get_cache, hash_bytes
+from risk_parser import RiskStreamParser
+from report_generator import create_pdf_report
+from metrics import span, write_prometheus, write_trace
+from findings_index import get_findings_index
+
+INDEX_BATCH = 50   # finished contracts written to the findings index per transaction
+
+def find_pdfs(root):
+    """
+    All PDFs under root, as sorted paths relative to it.
+    """
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.lower().endswith(".pdf"):
+                found.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return sorted(found)
+
+def load_done(output_path):
+    """
+    Relative paths already analyzed successfully in a previous run.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if row.get("status") == "ok":
+                done.add(row["file"])
+    return done
+
+def analyze_file(root, rel_path, reports_dir=None):
+    """
+    Extracts, analyzes and parses one contract; returns its JSONL record.
+    """
+    with span("contract", file=rel_path):
+        return _analyze_file(root, rel_path, reports_dir)
+
+def _analyze_file(root, rel_path, reports_dir):
+    started = time.time()
+    with open(os.path.join(root, rel_path), "rb") as fh:
+        data = fh.read()
+    doc_hash, cache = hash_bytes(data), get_cache()
+    row = {"file": rel_path, "sha256": doc_hash}
+
+    risks = cache.get_risks(doc_hash, analysis_version(), MODEL_NAME)
+    malformed, errors = 0, []
+    if risks is None:
+        text = cache.get_text(doc_hash, compaction_version())
+        if text is None:
+            compaction = {}
+            text = get_pdf_text(os.path.join(root, rel_path), stats=compaction)
+            row["tokens_saved"] = compaction.get("tokens_saved", 0)
+            if text.startswith("Error reading PDF"):
+                return {**row, "status": "error", "errors": [text], "seconds": round(time.time() - started, 3)}
+            cache.put_text(doc_hash, compaction_version(), text)
+        parser = RiskStreamParser()
+        parser.feed(analyze_contract(text))
+        parser.close()
+        risks, malformed, errors = parser.risks, len(parser.malformed), parser.errors
+        if not errors:
+            cache.put_risks(doc_hash, analysis_version(), MODEL_NAME, risks)
+
+    if reports_dir and not errors:
+        report_path = os.path.join(reports_dir, os.path.splitext(rel_path)[0] + ".pdf")
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, "wb") as fh:
+            fh.write(create_pdf_report(os.path.basename(rel_path), risks))
+        row["report"] = report_path
+
+    return {
+        **row,
+        "status": "error" if errors else "ok",
+        "counts": {k: len(v) for k, v in risks.items()},
+        "risks": risks,
+        "malformed": malformed,
+        "errors": errors,
+        "seconds": round(time.time() - started, 3),
+    }
+
+def run_batch(root, output_path, reports_dir=None, workers=4, max_inflight=8):
+    """
+    Analyzes every pending PDF under root and appends results to output_path.
+    Returns (processed, failed, elapsed_seconds).
+    """
+    set_inflight_limit(max_inflight)
+    done = load_done(output_path)
+    pending = [p for p in find_pdfs(root) if p not in done]
+    print(f"{len(done)} already done, {len(pending)} to analyze", file=sys.stderr)
+
+    write_lock = threading.Lock()
+    index, indexed = get_findings_index(), []
+    processed = failed = 0
+    started = time.time()
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_file, root, p, reports_dir): p for p in pending}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as e:
+                row = {"file": futures[future], "status": "error", "errors": [f"Error: {e}"]}
+            with write_lock:
+                out.write(json.dumps(row) + "\n")
+                out.flush()
+            if row["status"] == "ok":
+                indexed.append((row["sha256"], row["file"], row["risks"]))
+                if len(indexed) >= INDEX_BATCH:
+                    index.add_many(indexed)
+                    indexed = []
+            processed += 1
+            failed += row["status"] != "ok"
+            elapsed = time.time() - started
+            print(f"[{processed}/{len(pending)}] {row['status']:5} {row['file']} "
+                  f"({processed / elapsed * 60:.1f} contracts/min)", file=sys.stderr)
+    index.add_many(indexed)
+    return processed, failed, time.time() - started
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Analyze a directory of contracts without the UI.")
+    ap.add_argument("input_dir", help="directory searched recursively for PDFs")
+    ap.add_argument("--output", default="results.jsonl", help="JSONL results file (appended to, used for resume)")
+    ap.add_argument("--reports-dir", help="also write a PDF report per contract here")
+    ap.add_argument("--workers", type=int, default=4, help="contracts processed concurrently")
+    ap.add_argument("--max-inflight", type=int, default=8, help="global cap on concurrent Gemini requests")
+    ap.add_argument("--metrics-file", help="write Prometheus text-format metrics here when done")
+    ap.add_argument("--trace-file", help="write a Chrome trace-event JSON of every stage here when done")
+    args = ap.parse_args(argv)
+
+    processed, failed, elapsed = run_batch(args.input_dir, args.output, args.reports_dir, args.workers, args.max_inflight)
+    if args.metrics_file: write_prometheus(args.metrics_file)
+    if args.trace_file: write_trace(args.trace_file)
+    rate = processed / elapsed * 60 if elapsed else 0.0
+    print(f"Done: {processed} processed, {failed} failed in {elapsed:.1f}s ({rate:.1f} contracts/min)", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
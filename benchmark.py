@@ -0,0 +1,160 @@
+"""
+Offline micro-benchmarks for the non-LLM hot paths.
+
+    python benchmark.py                      # compare against the baseline, exit 1 on regression
+    python benchmark.py --update-baseline    # record a new baseline for this machine
+    python benchmark.py --quick              # smaller sizes, for a fast local check
+
+Covers PDF extraction (the bundled sample scaled up by repeating its pages),
+risk-record parsing, report_generator.clean_text and create_pdf_report from
+1 to 10,000 clauses. Throughput and peak traced memory per case are written
+as JSON. No network access is needed.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pypdf import PdfReader, PdfWriter
+
+from utils import get_pdf_text
+from risk_parser import parse_risks
+from report_generator import clean_text, create_pdf_report
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NeuroStack_Full_Terms_and_Conditions.pdf")
+BASELINE_PATH = "benchmark_baseline.json"
+THRESHOLD = 0.25  # allowed fractional slowdown / memory growth before a case fails
+MIN_SLOWDOWN = 0.001  # seconds per call; smaller slowdowns are timer noise and never fail
+MIN_GROWTH_KB = 64    # likewise for peak memory
+
+CLAUSE_SIZES = [1, 10, 100, 1000, 10000]
+PDF_SCALES = [1, 10, 100]
+QUICK_CLAUSE_SIZES = [1, 100, 1000]
+QUICK_PDF_SCALES = [1, 10]
+
+LEVELS = ("High", "Medium", "Low")
+
+def synthetic_response(n):
+    """
+    An analysis response with n well-formed records, as the model would emit it.
+    """
+    return "".join(
+        f"Clause {i}: Termination – “for convenience” | {LEVELS[i % 3]} | "
+        f"The supplier may terminate the agreement at any time without notice… | "
+        f"Require 30 days’ written notice and a cure period.\n###\n"
+        for i in range(n)
+    )
+
+def scaled_pdf(scale, directory):
+    """
+    Writes the bundled sample with its pages repeated scale times; returns the path.
+    """
+    path = os.path.join(directory, f"sample_x{scale}.pdf")
+    reader = PdfReader(SAMPLE_PDF)
+    writer = PdfWriter()
+    for _ in range(scale):
+        for page in reader.pages:
+            writer.add_page(page)
+    with open(path, "wb") as fh:
+        writer.write(fh)
+    return path, len(reader.pages) * scale
+
+def measure(fn, units, min_time=0.5, repeats=9):
+    """
+    Median per-call time over `repeats` timed runs of at least min_time each,
+    plus peak memory from a separate traced run.
+    Returns {"seconds", "per_second", "peak_kb"}.
+    """
+    fn()  # warm-up: first calls pay for lazy imports and font setup
+    timings = []
+    for _ in range(repeats):
+        loops, started = 0, time.perf_counter()
+        while True:
+            fn()
+            loops += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                break
+        timings.append(elapsed / loops)
+    median = statistics.median(timings)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(median, 6), "per_second": round(units / median, 2), "peak_kb": round(peak / 1024, 1)}
+
+def run_benchmarks(quick=False):
+    clause_sizes = QUICK_CLAUSE_SIZES if quick else CLAUSE_SIZES
+    pdf_scales = QUICK_PDF_SCALES if quick else PDF_SCALES
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in pdf_scales:
+            path, pages = scaled_pdf(scale, tmp)
+            results[f"get_pdf_text/pages={pages}"] = measure(lambda: get_pdf_text(path), pages, repeats=3 if pages > 50 else 9)
+
+    for n in clause_sizes:
+        raw = synthetic_response(n)
+        risks = parse_risks(raw)
+        fields = [v for items in risks.values() for item in items for v in (item["title"], item["expl"], item["fix"])]
+        results[f"parse_risks/clauses={n}"] = measure(lambda: parse_risks(raw), n)
+        results[f"clean_text/clauses={n}"] = measure(lambda: [clean_text(f) for f in fields], n)
+        results[f"create_pdf_report/clauses={n}"] = measure(lambda: create_pdf_report("benchmark.pdf", risks), n, repeats=3 if n >= 1000 else 9)
+
+    return results
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Lists the cases that got slower or hungrier than the baseline allows:
+    worse by more than threshold and by more than the absolute floors.
+    """
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if (now["per_second"] < before["per_second"] * (1 - threshold)
+                and now["seconds"] - before["seconds"] > MIN_SLOWDOWN):
+            regressions.append(f"{name}: throughput {now['per_second']}/s vs baseline {before['per_second']}/s")
+        if now["peak_kb"] > before["peak_kb"] * (1 + threshold) and now["peak_kb"] - before["peak_kb"] > MIN_GROWTH_KB:
+            regressions.append(f"{name}: peak memory {now['peak_kb']} KB vs baseline {before['peak_kb']} KB")
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline benchmarks for extraction, parsing and reporting.")
+    ap.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against / update")
+    ap.add_argument("--output", help="also write this run's results to a JSON file")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed fractional regression (default 0.25)")
+    ap.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    ap.add_argument("--quick", action="store_true", help="smaller sizes for a fast check")
+    args = ap.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick)
+    for name, r in results.items():
+        print(f"{name:40} {r['per_second']:>12.1f}/s {r['seconds'] * 1000:>10.2f} ms {r['peak_kb']:>10.1f} KB")
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as fh:
+            json.dump(results, fh, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    regressions = compare(results, baseline, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print("OK" if not regressions else f"{len(regressions)} regression(s)")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
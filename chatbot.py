@@ -1,24 +1,22 @@
-import os
-from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-
-load_dotenv()
+from metrics import LLMMetrics
+from llm_clients import get_llm, DEFAULT_MODEL
+from scheduler import get_scheduler, request_tokens, fit_budget, INTERACTIVE
 
 # --- GEMINI MODEL ---
-chat_model = ChatGoogleGenerativeAI(
-    model="gemini-flash-latest", 
-    api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.3
-)
+CHAT_MODEL = DEFAULT_MODEL
+CHAT_TEMPERATURE = 0.3
 
-def get_chat_response(question, contract_text, analysis_summary, chat_history):
-    """
-    Smarter Chatbot that knows the Dashboard Analysis.
-    """
-    
-    template = """
+# --- CHAT PROMPT CONFIG ---
+CHAT_RISK_LIMIT = 10        # High findings written out in the risk summary
+CHAT_RISK_CHARS = 2000      # the whole risk summary is cut to this
+MIN_CONTEXT_CHARS = 6000    # the token budget never cuts the contract context below this
+
+def _metrics_config(call):
+    return {"callbacks": [LLMMetrics(call, CHAT_MODEL, CHAT_TEMPERATURE)]}
+
+CHAT_TEMPLATE = """
     You are LexiSafe, an intelligent legal assistant.
     
     1. THE CONTRACT TEXT:
@@ -36,24 +34,108 @@ def get_chat_response(question, contract_text, analysis_summary, chat_history):
     INSTRUCTIONS:
     - Your main job is to explain the contract and the risks mentioned in the 'Dashboard Data'.
     - If the user asks about risks, REFER to the "Dashboard Data" provided above.
+    - The contract text may be a set of excerpts; if the answer is not in them, say so rather than guessing.
     - Do not contradict the system's analysis.
     - Keep answers short, professional, and easy to understand.
     """
-    
+
+def summarize_risks(risks, limit=CHAT_RISK_LIMIT):
+    """
+    Dashboard counts plus the first `limit` High findings, for the chat prompt.
+    """
+    high = risks['High']
+    summary = f"High: {len(high)}, Med: {len(risks['Medium'])}."
+    if high:
+        summary += "\nCritical:\n" + "\n".join(f"- {r['title']}: {r['expl']}" for r in high[:limit])
+    if len(high) > limit:
+        summary += f"\n- ...and {len(high) - limit} more High risks listed on the dashboard."
+    return summary
+
+def _clip(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars]
+
+def _chat_chain_and_inputs(question, contract_text, analysis_summary, chat_history, index):
+    context = index.context_for(question) if index is not None else contract_text
+
     prompt = PromptTemplate(
         input_variables=["context", "analysis_summary", "history", "question"],
-        template=template
+        template=CHAT_TEMPLATE
     )
     
-    chain = prompt | chat_model | StrOutputParser()
-    
+    chain = prompt | get_llm(CHAT_MODEL, CHAT_TEMPERATURE) | StrOutputParser()
+    inputs = {
+        "context": context,
+        "analysis_summary": _clip(analysis_summary, CHAT_RISK_CHARS),
+        "history": chat_history,
+        "question": question
+    }
+    # Whole contracts (no index) are cut to the chat budget rather than rejected;
+    # the risk summary is capped above so it cannot crowd the contract out
+    return chain, fit_budget("chat", inputs, CHAT_TEMPLATE, "context", minimum=MIN_CONTEXT_CHARS)
+
+def get_chat_response(question, contract_text, analysis_summary, chat_history, index=None):
+    """
+    Smarter Chatbot that knows the Dashboard Analysis.
+    When a retriever.ContractIndex is given, only the passages relevant to the
+    question are sent instead of the whole contract.
+    """
     try:
-        response = chain.invoke({
-            "context": contract_text,
-            "analysis_summary": analysis_summary,
-            "history": chat_history,
-            "question": question
-        })
+        chain, inputs = _chat_chain_and_inputs(question, contract_text, analysis_summary, chat_history, index)
+        response = get_scheduler().call(
+            lambda: chain.invoke(inputs, config=_metrics_config("chat")),
+            priority=INTERACTIVE, tokens=request_tokens(inputs, CHAT_TEMPLATE))
         return response
     except Exception as e:
-        return f"⚠️ AI Error: {str(e)}"
\ No newline at end of file
+        return f"⚠️ AI Error: {str(e)}"
+
+def stream_chat_response(question, contract_text, analysis_summary, chat_history, index=None):
+    """
+    Same as get_chat_response, but yields the reply as text chunks as they arrive.
+    """
+    try:
+        chain, inputs = _chat_chain_and_inputs(question, contract_text, analysis_summary, chat_history, index)
+        for chunk in get_scheduler().stream(
+                lambda: chain.stream(inputs, config=_metrics_config("chat")),
+                priority=INTERACTIVE, tokens=request_tokens(inputs, CHAT_TEMPLATE)):
+            yield chunk
+    except Exception as e:
+        yield f"⚠️ AI Error: {str(e)}"
+
+def warm_up():
+    """
+    Builds the chat model client ahead of the first question.
+    """
+    get_llm(CHAT_MODEL, CHAT_TEMPERATURE)
+
+def summarize_history(previous_summary, turns):
+    """
+    Folds older chat turns into the running conversation summary. Runs in
+    the interactive lane: ConversationMemory calls it while the user waits.
+    """
+    template = """
+    Update the running summary of a conversation about a contract.
+
+    CURRENT SUMMARY:
+    {summary}
+
+    NEW TURNS TO ADD:
+    {turns}
+
+    INSTRUCTIONS:
+    - Return only the updated summary, at most 120 words.
+    - Keep facts the user established, clauses discussed and open questions.
+    """
+
+    prompt = PromptTemplate(
+        input_variables=["summary", "turns"],
+        template=template
+    )
+
+    chain = prompt | get_llm(CHAT_MODEL, CHAT_TEMPERATURE) | StrOutputParser()
+    inputs = fit_budget("chat_summary", {"summary": previous_summary or "(none)", "turns": turns}, template, "turns")
+    return get_scheduler().call(
+        lambda: chain.invoke(inputs, config=_metrics_config("chat_summary")),
+        priority=INTERACTIVE, tokens=request_tokens(inputs, template))
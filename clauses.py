@@ -0,0 +1,75 @@
+import hashlib
+import re
+
+# --- SEGMENTATION CONFIG ---
+MIN_CLAUSE_CHARS = 40     # shorter pieces (headings, stray lines) join the next clause
+MAX_CLAUSE_CHARS = 4000   # longer ones are cut at sentence breaks
+
+# Top-level clause numbering: "12.", "4.2", "3)", "Section 5", "Article IV"
+NUMBERING = r"(?:(?:section|article|clause|schedule)\s+[\dIVXLC]+(?:\.\d+)*\b[.:)]?|\d+(?:\.\d+)+\.?|\d+[.)])"
+CLAUSE_START = re.compile(rf"^[ \t]*{NUMBERING}[ \t]+", re.I | re.M)
+# A line in capitals on its own, e.g. "LIMITATION OF LIABILITY"
+HEADING = re.compile(r"^[ \t]*[A-Z][A-Z0-9 ,&'/\-]{2,80}[ \t]*$", re.M)
+PARAGRAPH = re.compile(r"\n[ \t]*\n")
+
+LEADING_NUMBER = re.compile(rf"^\s*{NUMBERING}\s*", re.I)
+CROSS_REFERENCE = re.compile(r"\b(section|article|clause|schedule)\s+[\dIVXLC]+(?:\.\d+)*\b", re.I)
+
+def _is_heading(piece):
+    return len(piece) < MIN_CLAUSE_CHARS or bool(HEADING.fullmatch(piece))
+
+def segment_clauses(text, min_chars=MIN_CLAUSE_CHARS, max_chars=MAX_CLAUSE_CHARS):
+    """
+    Splits contract text into clauses using numbering, capitalised headings and
+    paragraph breaks. Returns dicts with start/end offsets into text, the clause
+    text and the heading it sits under ("" when there is none). Pair the offsets
+    with pdf_extract.page_for_offset to point back at pages.
+    """
+    cuts = {0, len(text)}
+    cuts.update(m.start() for m in CLAUSE_START.finditer(text))
+    cuts.update(i for m in HEADING.finditer(text) for i in m.span())
+    cuts.update(m.end() for m in PARAGRAPH.finditer(text))
+    cuts = sorted(cuts)
+
+    clauses = []
+    heading, start = "", None
+    for a, b in zip(cuts, cuts[1:]):
+        piece = text[a:b]
+        a += len(piece) - len(piece.lstrip())
+        b -= len(piece) - len(piece.rstrip())
+        if a >= b:
+            continue
+        piece = text[a:b]
+        if start is None:
+            start = a
+            # A numbered clause whose first line is a title ("10. Termination") starts a new heading
+            title = piece.split("\n", 1)[0].strip()
+            if CLAUSE_START.match(title + " ") and len(title) < 80 and not title.endswith((".", ";", ":")):
+                heading = LEADING_NUMBER.sub("", title) or heading
+        if _is_heading(piece) and b != len(text.rstrip()):
+            if HEADING.fullmatch(piece):
+                heading = piece.strip()
+            continue
+
+        # Overlong clauses are cut at sentence breaks
+        while b - start > max_chars:
+            stop = text.rfind(". ", start, start + max_chars)
+            stop = stop + 1 if stop > start + min_chars else start + max_chars
+            clauses.append({"start": start, "end": stop, "text": text[start:stop], "heading": heading})
+            start = stop + len(text[stop:b]) - len(text[stop:b].lstrip())
+        clauses.append({"start": start, "end": b, "text": text[start:b], "heading": heading})
+        start = None
+    return clauses
+
+def normalize_clause(text):
+    """
+    Canonical form used to recognise the same clause across documents: case and
+    whitespace are folded, and clause numbering and cross-references are replaced.
+    Other numbers (notice periods, amounts, caps) are kept because they change the risk.
+    """
+    text = LEADING_NUMBER.sub("", text)
+    text = CROSS_REFERENCE.sub(r"\1 #", text)
+    return " ".join(text.lower().split())
+
+def clause_hash(text):
+    return hashlib.sha256(normalize_clause(text).encode("utf-8")).hexdigest()
@@ -0,0 +1,99 @@
+import os
+import re
+from collections import Counter
+from metrics import inc, estimate_tokens
+
+# --- COMPACTION CONFIG ---
+# Extracted pages are cleaned before anything is sent to the model: running
+# headers/footers and page numbers go, hyphenated line breaks are rejoined and
+# whitespace runs collapse. LEXISAFE_COMPACT=off keeps the raw extraction.
+COMPACT_ENABLED = os.getenv("LEXISAFE_COMPACT", "on").lower() not in ("0", "off", "false", "no")
+EDGE_LINES = 3        # lines checked at the top and bottom of each page
+MIN_PAGES = 3         # fewer pages can't show a repeating header
+REPEAT_RATIO = 0.5    # a line on at least this share of pages is a header/footer
+MAX_EDGE_CHARS = 100  # running headers/footers are short; longer lines are body text
+# Bump whenever the cleaning rules change so cached extractions are redone
+COMPACT_VERSION = "1"
+
+PAGE_NUMBER = re.compile(r"(?:page\s*)?\d+(?:\s*(?:of|/)\s*\d+)?|-\s*\d+\s*-|\[?\d+\]?", re.I)
+PAGE_REF = re.compile(r"\bpage\s*\d+(?:\s*(?:of|/)\s*\d+)?|\b\d+\s*(?:of|/)\s*\d+\b|-\s*\d+\s*-", re.I)
+HYPHEN_BREAK = re.compile(r"(\w)-[ \t]*\n[ \t]*([a-z])")
+SPACE_RUN = re.compile(r"[ \t\u00a0\f\v]+")
+LINE_EDGES = re.compile(r" ?\n ?")
+BLANK_RUN = re.compile(r"\n{3,}")
+
+def compaction_version():
+    """
+    Cache version for extracted text: which cleaning, if any, produced it.
+    """
+    return f"compact-{COMPACT_VERSION}" if COMPACT_ENABLED else "raw"
+
+def _line_key(line):
+    # Page references vary between pages ("Page 3 of 9"), so they don't count;
+    # other numbers do, or "Section 3" / "Section 4" headings would look repeated
+    return PAGE_REF.sub("#", " ".join(line.lower().split()))
+
+def _edge_keys(lines):
+    # Headers are only compared with headers and footers with footers
+    top = {("top", _line_key(l)) for l in lines[:EDGE_LINES] if len(l.strip()) <= MAX_EDGE_CHARS}
+    bottom = {("bottom", _line_key(l)) for l in lines[-EDGE_LINES:] if len(l.strip()) <= MAX_EDGE_CHARS}
+    return top | bottom
+
+def _is_edge_noise(line, edge, repeated):
+    stripped = line.strip()
+    return (not stripped or PAGE_NUMBER.fullmatch(stripped)
+            or (len(stripped) <= MAX_EDGE_CHARS and (edge, _line_key(line)) in repeated))
+
+def _strip_edges(lines, repeated):
+    start, end = 0, len(lines)
+    for _ in range(EDGE_LINES + 1):
+        if start < end and _is_edge_noise(lines[start], "top", repeated):
+            start += 1
+            while start < end and not lines[start].strip():
+                start += 1
+    for _ in range(EDGE_LINES + 1):
+        if end > start and _is_edge_noise(lines[end - 1], "bottom", repeated):
+            end -= 1
+            while end > start and not lines[end - 1].strip():
+                end -= 1
+    return lines[start:end]
+
+def compact_text(text):
+    """
+    Rejoins words hyphenated across line breaks and collapses whitespace,
+    keeping single newlines and paragraph breaks for clause segmentation.
+    """
+    text = HYPHEN_BREAK.sub(r"\1\2", text)
+    text = SPACE_RUN.sub(" ", text)
+    text = LINE_EDGES.sub("\n", text)
+    return BLANK_RUN.sub("\n\n", text).strip()
+
+def compact_pages(pages, stats=None):
+    """
+    Cleans extracted page texts (see the module config). Empty pages stay empty
+    so page numbering is unchanged. When a stats dict is given it receives
+    chars/tokens before and after and the number of header/footer lines removed.
+    """
+    edges = [[l for l in page.splitlines() if l.strip()] for page in pages]
+    counts = Counter()
+    for lines in edges:
+        counts.update(_edge_keys(lines))
+    used = sum(1 for lines in edges if lines)
+    threshold = max(MIN_PAGES, used * REPEAT_RATIO)
+    repeated = {k for k, c in counts.items() if used >= MIN_PAGES and c >= threshold}
+
+    out, removed = [], 0
+    for page in pages:
+        lines = page.splitlines()
+        kept = _strip_edges(lines, repeated)
+        removed += sum(1 for l in lines if l.strip()) - sum(1 for l in kept if l.strip())
+        out.append(compact_text("\n".join(kept)))
+
+    before = sum(len(p) for p in pages)
+    after = sum(len(p) for p in out)
+    saved = max(estimate_tokens("".join(pages)) - estimate_tokens("".join(out)), 0)
+    inc("compaction_documents_total")
+    inc("compaction_tokens_saved_total", saved)
+    if stats is not None:
+        stats.update(chars_before=before, chars_after=after, tokens_saved=saved, edge_lines_removed=removed)
+    return out
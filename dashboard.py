@@ -0,0 +1,153 @@
+import json
+from collections import defaultdict
+from clauses import segment_clauses, clause_hash
+from pdf_extract import page_for_offset
+from risk_parser import record_key
+
+# --- DASHBOARD CONFIG ---
+PAGE_SIZE = 25       # findings per dashboard page
+HEIGHT = 760         # pixels; the list pages instead of growing the iframe
+BUCKETS = ("High", "Medium", "Low")
+
+def finding_pages(text, offsets, findings):
+    """
+    {normalized title: sorted page numbers} for findings tied to a clause.
+    Findings from whole-document windows have no clause, so they get no pages.
+    """
+    if not (text and offsets and findings):
+        return {}
+    pages = defaultdict(set)
+    for clause in segment_clauses(text):
+        raw = findings.get(clause_hash(clause["text"]))
+        if not raw:
+            continue
+        page = page_for_offset(offsets, clause["start"])
+        for record in raw.split("###"):
+            if record.strip():
+                pages[record_key(record)[0]].add(page)
+    return {title: sorted(p) for title, p in pages.items()}
+
+def build_view_model(risks, text=None, offsets=None, findings=None):
+    """
+    Everything the dashboard shows for one document, computed once per analysis:
+    the counts per risk level and one flat row per finding, with its pages.
+    """
+    pages = finding_pages(text, offsets, findings)
+    rows = []
+    for bucket in BUCKETS:
+        for item in risks.get(bucket, []):
+            rows.append({
+                "risk": bucket,
+                "title": item["title"],
+                "expl": item["expl"],
+                "fix": item["fix"],
+                "pages": pages.get(record_key(item["title"])[0], []),
+            })
+    return {
+        "counts": {bucket: len(risks.get(bucket, [])) for bucket in BUCKETS},
+        "rows": rows,
+        "pages": sorted({p for row in rows for p in row["pages"]}),
+    }
+
+def render_html(view, page_size=PAGE_SIZE):
+    """
+    The findings list as one self-contained HTML document: search by title,
+    filter by risk level and page, and pagination all run in the browser, so
+    none of it costs a Streamlit rerun. Text is inserted with textContent,
+    never as markup.
+    """
+    data = json.dumps({"rows": view["rows"], "pages": view["pages"], "pageSize": page_size})
+    # A "</script>" inside a finding must not end the script block
+    data = data.replace("</", "<\\/")
+    return _TEMPLATE.replace("__DATA__", data)
+
+_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><style>
+@import url('https://fonts.googleapis.com/css2?family=Outfit:wght@300;400;600;800&display=swap');
+body { margin: 0; font-family: 'Outfit', sans-serif; background: #0E1117; color: #FAFAFA; }
+.bar { display: flex; gap: 10px; flex-wrap: wrap; align-items: center; margin-bottom: 14px; }
+.bar input, .bar select { background: #161B22; color: #FAFAFA; border: 1px solid #30363D; border-radius: 6px; padding: 8px 10px; font: inherit; }
+.bar input { flex: 1; min-width: 200px; }
+.level { background: #161B22; color: #C9D1D9; border: 1px solid #30363D; border-radius: 6px; padding: 8px 12px; cursor: pointer; font: inherit; }
+.level.on { border-color: #58A6FF; color: #FFF; }
+.risk-card { background-color: #161B22; padding: 20px; border-radius: 10px; margin-bottom: 15px; border: 1px solid #30363D; transition: transform 0.2s ease; }
+.risk-card:hover { transform: translateX(5px); background-color: #1c2128; }
+.High { border-left: 4px solid #FF4B4B; } .Medium { border-left: 4px solid #FFA726; } .Low { border-left: 4px solid #00C9FF; }
+.card-title { font-size: 1.1rem; font-weight: 700; color: #FFF; margin-bottom: 5px; }
+.card-meta { font-size: 0.8rem; color: #8B949E; margin-bottom: 8px; }
+.card-expl { color: #C9D1D9; font-size: 0.95rem; margin-bottom: 10px; }
+.card-fix { margin-top: 12px; background: rgba(56, 139, 253, 0.1); padding: 10px; border-radius: 6px; color: #58A6FF; border-left: 3px solid #58A6FF; }
+.pager { display: flex; gap: 10px; align-items: center; justify-content: center; color: #8B949E; font-size: 0.9rem; margin: 10px 0 20px; }
+.pager button { background: #238636; color: white; border: none; border-radius: 6px; padding: 6px 14px; cursor: pointer; font: inherit; }
+.pager button:disabled { background: #30363D; cursor: default; }
+.empty { text-align: center; padding: 20px; color: #666; }
+</style></head><body>
+<div class="bar">
+  <input id="q" type="search" placeholder="Search findings by title...">
+  <button class="level on" data-level="">All</button>
+  <button class="level" data-level="High">🔥 Critical</button>
+  <button class="level" data-level="Medium">⚠️ Warnings</button>
+  <button class="level" data-level="Low">✅ Safe</button>
+  <select id="page"><option value="">All pages</option></select>
+</div>
+<div id="list"></div>
+<div class="pager"><button id="prev">‹ Prev</button><span id="info"></span><button id="next">Next ›</button></div>
+<script>
+const DATA = __DATA__;
+const rows = DATA.rows.map(r => Object.assign(r, {key: r.title.toLowerCase()}));
+const state = {q: "", level: "", page: "", at: 0};
+const $ = id => document.getElementById(id);
+for (const p of DATA.pages) $("page").add(new Option("Page " + p, p));
+
+function el(tag, cls, text) {
+  const e = document.createElement(tag);
+  if (cls) e.className = cls;
+  if (text !== undefined) e.textContent = text;
+  return e;
+}
+
+function card(r) {
+  const c = el("div", "risk-card " + r.risk);
+  c.appendChild(el("div", "card-title", r.title));
+  if (r.pages.length) c.appendChild(el("div", "card-meta", (r.pages.length > 1 ? "Pages " : "Page ") + r.pages.join(", ")));
+  c.appendChild(el("div", "card-expl", r.expl));
+  const fix = el("div", "card-fix");
+  fix.appendChild(el("b", null, "💡 Fix: "));
+  fix.appendChild(document.createTextNode(r.fix));
+  c.appendChild(fix);
+  return c;
+}
+
+function render() {
+  const page = state.page === "" ? null : Number(state.page);
+  const hits = rows.filter(r => (!state.level || r.risk === state.level)
+    && (!state.q || r.key.includes(state.q))
+    && (page === null || r.pages.includes(page)));
+  state.at = Math.min(state.at, Math.max(hits.length - 1, 0));
+  state.at -= state.at % DATA.pageSize;
+  const shown = hits.slice(state.at, state.at + DATA.pageSize);
+  // One fragment per page: a single layout pass however many cards there are
+  const frag = document.createDocumentFragment();
+  if (!shown.length) frag.appendChild(el("div", "empty", "No findings match."));
+  for (const r of shown) frag.appendChild(card(r));
+  $("list").replaceChildren(frag);
+  $("info").textContent = hits.length ? (state.at + 1) + "–" + (state.at + shown.length) + " of " + hits.length : "0 of 0";
+  $("prev").disabled = state.at === 0;
+  $("next").disabled = state.at + DATA.pageSize >= hits.length;
+}
+
+let timer;
+$("q").addEventListener("input", e => {
+  clearTimeout(timer);
+  timer = setTimeout(() => { state.q = e.target.value.trim().toLowerCase(); state.at = 0; render(); }, 120);
+});
+for (const b of document.querySelectorAll(".level")) b.addEventListener("click", () => {
+  document.querySelectorAll(".level").forEach(x => x.classList.toggle("on", x === b));
+  state.level = b.dataset.level; state.at = 0; render();
+});
+$("page").addEventListener("change", e => { state.page = e.target.value; state.at = 0; render(); });
+$("prev").addEventListener("click", () => { state.at = Math.max(state.at - DATA.pageSize, 0); render(); window.scrollTo(0, 0); });
+$("next").addEventListener("click", () => { state.at += DATA.pageSize; render(); window.scrollTo(0, 0); });
+render();
+</script></body></html>
+"""
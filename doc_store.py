@@ -0,0 +1,194 @@
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from analysis_cache import CACHE_DIR
+from metrics import inc, set_gauge
+
+# --- DOCUMENT STORE CONFIG ---
+# Sessions keep only a document hash; the text, risks and version snapshot of each
+# document are stored once, zlib-compressed on disk, with the hottest ones in memory.
+STORE_DIR = os.getenv("LEXISAFE_DOCSTORE_DIR", os.path.join(CACHE_DIR, "docs"))
+MEMORY_BYTES = int(float(os.getenv("LEXISAFE_DOCSTORE_MEMORY_MB", "64")) * 1024 * 1024)
+DISK_BYTES = int(float(os.getenv("LEXISAFE_DOCSTORE_MAX_MB", "2048")) * 1024 * 1024)
+COMPRESS_LEVEL = 6
+SESSION_TTL = 3600    # sessions not seen for this long drop out of the memory report
+
+def deep_sizeof(obj, seen=None):
+    """
+    Approximate memory held by obj and everything it references, in bytes.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+class DocumentStore:
+    """
+    Per-document values (text, risks, snapshot, ...) keyed by (document hash, kind).
+    Each value is one compressed JSON file; reads go through an LRU of decoded
+    values bounded by memory_bytes, and the files are pruned least recently
+    used first once they pass disk_bytes. Values are shared between sessions,
+    so callers must not mutate what get() returns.
+    """
+
+    def __init__(self, path=None, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES):
+        self.path = path or STORE_DIR
+        os.makedirs(self.path, exist_ok=True)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()   # (doc_hash, kind) -> (value, size)
+        self._memory = 0
+        self._disk = None           # measured on the first write
+
+    def _file(self, doc_hash, kind):
+        return os.path.join(self.path, doc_hash[:2], f"{doc_hash}.{kind}.json.z")
+
+    def _remember(self, key, value, size):
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._memory -= old[1]
+        if size > self.memory_bytes:
+            return
+        self._lru[key] = (value, size)
+        self._memory += size
+        while self._memory > self.memory_bytes:
+            _, (_, dropped) = self._lru.popitem(last=False)
+            self._memory -= dropped
+        set_gauge("docstore_memory_bytes", self._memory)
+        set_gauge("docstore_memory_entries", len(self._lru))
+
+    def get(self, doc_hash, kind):
+        """
+        The stored value, or None when the document has none of this kind.
+        """
+        key = (doc_hash, kind)
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit is not None:
+                self._lru.move_to_end(key)
+                inc("cache_requests_total", cache="docstore", kind=kind, result="hit")
+                return hit[0]
+        path = self._file(doc_hash, kind)
+        try:
+            with open(path, "rb") as fh:
+                raw = zlib.decompress(fh.read())
+            os.utime(path)  # recency for disk pruning
+        except (OSError, zlib.error):
+            inc("cache_requests_total", cache="docstore", kind=kind, result="miss")
+            return None
+        value = json.loads(raw)
+        inc("cache_requests_total", cache="docstore", kind=kind, result="disk")
+        with self._lock:
+            self._remember(key, value, len(raw))
+        return value
+
+    def put(self, doc_hash, kind, value):
+        raw = json.dumps(value).encode("utf-8")
+        data = zlib.compress(raw, COMPRESS_LEVEL)
+        path = self._file(doc_hash, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        os.replace(tmp, path)
+        inc("docstore_bytes_written_total", len(data), kind=kind)
+        with self._lock:
+            # Decoded fresh so later edits to value by the caller can't reach other sessions
+            self._remember((doc_hash, kind), json.loads(raw), len(raw))
+            if self._disk is None:
+                self._disk = self._disk_usage()
+            else:
+                self._disk += len(data) - previous
+            if self.disk_bytes and self._disk > self.disk_bytes:
+                self._prune()
+
+    def _disk_usage(self):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(self.path) for name in names)
+
+    def _prune(self):
+        files = []
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+        self._disk = sum(size for _, size, _ in files)
+        # Down to 90% so a busy store doesn't prune on every write
+        for _, size, path in files:
+            if self._disk <= self.disk_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._disk -= size
+            name = os.path.basename(path)
+            doc_hash, kind = name.split(".")[:2]
+            dropped = self._lru.pop((doc_hash, kind), None)
+            if dropped is not None:
+                self._memory -= dropped[1]
+            inc("docstore_evictions_total", kind=kind)
+
+    def get_text(self, doc_hash, version):
+        return self.get(doc_hash, f"text-{version}")
+
+    def put_text(self, doc_hash, version, text):
+        self.put(doc_hash, f"text-{version}", text)
+
+    def get_pages(self, doc_hash, version):
+        return self.get(doc_hash, f"pages-{version}")
+
+    def put_pages(self, doc_hash, version, offsets):
+        self.put(doc_hash, f"pages-{version}", offsets)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_doc_store():
+    """
+    Returns the process-wide document store, opening it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocumentStore()
+        return _store
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def report_session(session_id, nbytes):
+    """
+    Records the memory held by one session's state and updates the session gauges.
+    """
+    now = time.time()
+    with _sessions_lock:
+        _sessions[session_id] = (nbytes, now)
+        for sid in [s for s, (_, seen) in _sessions.items() if now - seen > SESSION_TTL]:
+            del _sessions[sid]
+        sizes = [b for b, _ in _sessions.values()]
+    set_gauge("sessions_active", len(sizes))
+    set_gauge("session_state_bytes_total", sum(sizes))
+    set_gauge("session_state_bytes_max", max(sizes))
@@ -1,34 +1,16 @@
-import os
-from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-
-load_dotenv()
+from metrics import LLMMetrics
+from llm_clients import get_llm, DEFAULT_MODEL
+from scheduler import get_scheduler, request_tokens, fit_budget, BACKGROUND
 
 # --- GEMINI MODEL ---
-# FIX: Removed '-latest' which was causing the 404 Error
-email_model = ChatGoogleGenerativeAI(
-    model="gemini-flash-latest", 
-    api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.7 
-)
-
-def generate_email(contract_name, risks):
-    """
-    Generates a professional negotiation email based on detected risks.
-    """
-    
-    risk_summary = ""
-    for r in risks['High']:
-        risk_summary += f"- Critical Issue: {r['title']}. Reason: {r['expl']}. Proposed Fix: {r['fix']}\n"
-    for r in risks['Medium']:
-        risk_summary += f"- Concern: {r['title']}. Reason: {r['expl']}. Proposed Fix: {r['fix']}\n"
+EMAIL_MODEL = DEFAULT_MODEL
+EMAIL_TEMPERATURE = 0.7
 
-    if not risk_summary:
-        return "Subject: Contract Review - Ready to Sign\n\nDear Team,\n\nWe have reviewed the contract and found no significant risks. We are ready to proceed.\n\nBest regards,\n[Your Name]"
+NO_RISK_EMAIL = "Subject: Contract Review - Ready to Sign\n\nDear Team,\n\nWe have reviewed the contract and found no significant risks. We are ready to proceed.\n\nBest regards,\n[Your Name]"
 
-    template = """
+EMAIL_TEMPLATE = """
     You are a professional corporate lawyer representing a client.
     Your task is to draft a polite but firm negotiation email to the counterparty regarding the contract: "{contract_name}".
 
@@ -45,17 +27,65 @@ def generate_email(contract_name, risks):
     - Do not use placeholders like [Your Name], just keep it generic like "Legal Team".
     """
 
+def _summarize_risks(risks):
+    risk_summary = ""
+    for r in risks['High']:
+        risk_summary += f"- Critical Issue: {r['title']}. Reason: {r['expl']}. Proposed Fix: {r['fix']}\n"
+    for r in risks['Medium']:
+        risk_summary += f"- Concern: {r['title']}. Reason: {r['expl']}. Proposed Fix: {r['fix']}\n"
+    return risk_summary
+
+def _metrics_config():
+    return {"callbacks": [LLMMetrics("email", EMAIL_MODEL, EMAIL_TEMPERATURE)]}
+
+def _email_chain():
     prompt = PromptTemplate(
         input_variables=["contract_name", "risks"],
-        template=template
+        template=EMAIL_TEMPLATE
     )
 
-    chain = prompt | email_model | StrOutputParser()
+    return prompt | get_llm(EMAIL_MODEL, EMAIL_TEMPERATURE) | StrOutputParser()
+
+def generate_email(contract_name, risks):
+    """
+    Generates a professional negotiation email based on detected risks.
+    """
+    
+    risk_summary = _summarize_risks(risks)
+    if not risk_summary:
+        return NO_RISK_EMAIL
+
+    try:
+        chain = _email_chain()
+        # High risks come first, so an over-budget list loses Medium concerns first
+        inputs = fit_budget("email", {
+            "contract_name": contract_name,
+            "risks": risk_summary
+        }, EMAIL_TEMPLATE, "risks")
+        return get_scheduler().call(
+            lambda: chain.invoke(inputs, config=_metrics_config()),
+            priority=BACKGROUND, tokens=request_tokens(inputs, EMAIL_TEMPLATE))
+    except Exception as e:
+        return f"Error generating email: {str(e)}"
+
+def stream_email(contract_name, risks):
+    """
+    Same as generate_email, but yields the draft as text chunks as they arrive.
+    """
+    risk_summary = _summarize_risks(risks)
+    if not risk_summary:
+        yield NO_RISK_EMAIL
+        return
 
     try:
-        return chain.invoke({
+        chain = _email_chain()
+        inputs = fit_budget("email", {
             "contract_name": contract_name,
             "risks": risk_summary
-        })
+        }, EMAIL_TEMPLATE, "risks")
+        for chunk in get_scheduler().stream(
+                lambda: chain.stream(inputs, config=_metrics_config()),
+                priority=BACKGROUND, tokens=request_tokens(inputs, EMAIL_TEMPLATE)):
+            yield chunk
     except Exception as e:
-        return f"Error generating email: {str(e)}"
\ No newline at end of file
+        yield f"Error generating email: {str(e)}"
@@ -0,0 +1,230 @@
+"""
+Portfolio-wide index of findings, searchable across every analyzed contract.
+
+    python findings_index.py search "uncapped liability OR data sale" --risk High
+    python findings_index.py import results.jsonl     # backfill from batch.py output
+    python findings_index.py stats
+
+Findings are stored in SQLite with an FTS5 index over title, explanation and
+fix. Each analysis replaces the document's earlier findings, so re-analyzing
+a contract never duplicates them.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from analysis_cache import CACHE_DIR
+from metrics import inc, span
+
+# --- FINDINGS INDEX CONFIG ---
+INDEX_ENABLED = os.getenv("LEXISAFE_FINDINGS_INDEX", "on").lower() not in ("0", "off", "false", "no")
+INDEX_PATH = os.path.join(CACHE_DIR, "findings.sqlite3")
+RISK_ORDER = {"High": 0, "Medium": 1, "Low": 2}
+FIELDS = ("doc_hash", "name", "risk", "title", "expl", "fix")
+
+TERM = re.compile(r"\w+", re.UNICODE)
+
+def fts_query(text):
+    """
+    Turns what a user types into a safe FTS5 query: words are ANDed (each one a
+    prefix match), and an uppercase OR separates alternatives, so
+    'uncapped liab OR data sale' finds either phrase's words.
+    """
+    groups = []
+    for part in re.split(r"\s+OR\s+", text):
+        terms = [f'"{t}"*' for t in TERM.findall(part)]
+        if terms:
+            groups.append("(" + " AND ".join(terms) + ")")
+    return " OR ".join(groups)
+
+class FindingsIndex:
+    """
+    findings holds one row per finding; findings_fts indexes its text and is
+    kept in step by triggers. documents keeps each contract's name and counts.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = INDEX_PATH
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_hash TEXT PRIMARY KEY, name TEXT NOT NULL, analyzed REAL NOT NULL,
+                    high INTEGER NOT NULL, medium INTEGER NOT NULL, low INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS findings (
+                    id INTEGER PRIMARY KEY, doc_hash TEXT NOT NULL, risk TEXT NOT NULL,
+                    title TEXT NOT NULL, expl TEXT NOT NULL, fix TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS findings_doc ON findings(doc_hash);
+                CREATE VIRTUAL TABLE IF NOT EXISTS findings_fts USING fts5(
+                    title, expl, fix, content='findings', content_rowid='id', tokenize='porter unicode61');
+                CREATE TRIGGER IF NOT EXISTS findings_ai AFTER INSERT ON findings BEGIN
+                    INSERT INTO findings_fts(rowid, title, expl, fix) VALUES (new.id, new.title, new.expl, new.fix);
+                END;
+                CREATE TRIGGER IF NOT EXISTS findings_ad AFTER DELETE ON findings BEGIN
+                    INSERT INTO findings_fts(findings_fts, rowid, title, expl, fix)
+                    VALUES ('delete', old.id, old.title, old.expl, old.fix);
+                END;
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add_many(self, documents):
+        """
+        Indexes (doc_hash, name, risks) triples in one transaction, replacing
+        whatever each document had before, including earlier entries of the same batch.
+        """
+        # A hash listed twice (identical files under two names) is indexed once; the last one wins
+        documents = list({doc_hash: (doc_hash, name, risks) for doc_hash, name, risks in documents}.values())
+        if not documents:
+            return
+        now = time.time()
+        rows = [(doc_hash, bucket, item["title"], item["expl"], item["fix"])
+                for doc_hash, _, risks in documents
+                for bucket in RISK_ORDER for item in risks.get(bucket, [])]
+        with span("findings_index", documents=len(documents), findings=len(rows)):
+            with self._lock, self._connect() as conn:
+                conn.executemany("DELETE FROM findings WHERE doc_hash = ?", [(d[0],) for d in documents])
+                conn.executemany(
+                    "INSERT OR REPLACE INTO documents (doc_hash, name, analyzed, high, medium, low) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(doc_hash, name, now, *(len(risks.get(b, [])) for b in RISK_ORDER))
+                     for doc_hash, name, risks in documents])
+                conn.executemany("INSERT INTO findings (doc_hash, risk, title, expl, fix) VALUES (?, ?, ?, ?, ?)", rows)
+        inc("findings_indexed_total", len(rows))
+
+    def add(self, doc_hash, name, risks):
+        self.add_many([(doc_hash, name, risks)])
+
+    def _select(self, query, risks, order, limit=None):
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = ("SELECT f.doc_hash, d.name, f.risk, f.title, f.expl, f.fix "
+               "FROM findings_fts JOIN findings f ON f.id = findings_fts.rowid "
+               "JOIN documents d ON d.doc_hash = f.doc_hash WHERE findings_fts MATCH ?")
+        params = [match]
+        if risks:
+            sql += f" AND f.risk IN ({','.join('?' * len(risks))})"
+            params += list(risks)
+        sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with span("findings_search"), self._connect() as conn:
+            return [dict(zip(FIELDS, row)) for row in conn.execute(sql, params)]
+
+    def search(self, query, risks=None, limit=200):
+        """
+        Findings matching the query, best matches first, as dicts with the
+        document's hash and name. risks optionally restricts the levels.
+        """
+        # Title matches count most
+        return self._select(query, risks, "bm25(findings_fts, 4.0, 1.0, 1.0)", limit)
+
+    def documents(self, query, risks=None, limit=200):
+        """
+        Contracts with at least one matching finding, most severe match first,
+        each with its matching findings: "which of our contracts have ...".
+        limit=None returns them all.
+        """
+        docs = {}
+        for hit in self._select(query, risks, "f.id"):
+            doc = docs.setdefault(hit["doc_hash"], {"doc_hash": hit["doc_hash"], "name": hit["name"], "findings": []})
+            doc["findings"].append(hit)
+        ranked = sorted(docs.values(), key=lambda d: (min(RISK_ORDER[f["risk"]] for f in d["findings"]), d["name"]))
+        return ranked if limit is None else ranked[:limit]
+
+    def stats(self):
+        with self._connect() as conn:
+            documents = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            findings = conn.execute("SELECT COUNT(*) FROM findings").fetchone()[0]
+        return {"documents": documents, "findings": findings}
+
+class _NullIndex:
+    """
+    Stand-in used when the index is switched off.
+    """
+
+    def add_many(self, documents): pass
+    def add(self, doc_hash, name, risks): pass
+    def search(self, query, risks=None, limit=200): return []
+    def documents(self, query, risks=None, limit=200): return []
+    def stats(self): return {"documents": 0, "findings": 0}
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_findings_index():
+    """
+    Returns the process-wide index, opening it on first use.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FindingsIndex() if INDEX_ENABLED else _NullIndex()
+        return _index
+
+def import_results(path, index, batch_size=500):
+    """
+    Indexes the successful rows of a batch.py results file; returns the number of documents.
+    """
+    count, pending = 0, []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if row.get("status") != "ok" or "sha256" not in row:
+                continue
+            pending.append((row["sha256"], row["file"], row["risks"]))
+            if len(pending) >= batch_size:
+                index.add_many(pending)
+                count += len(pending)
+                pending = []
+    index.add_many(pending)
+    return count + len(pending)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Search findings across every analyzed contract.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("search", help="print matching contracts and findings")
+    s.add_argument("query")
+    s.add_argument("--risk", action="append", choices=list(RISK_ORDER), help="repeat to allow several levels")
+    s.add_argument("--limit", type=int, default=50)
+    s.add_argument("--json", action="store_true", help="print the matches as JSON")
+    i = sub.add_parser("import", help="index the results of a batch.py run")
+    i.add_argument("results")
+    sub.add_parser("stats", help="print how many contracts and findings are indexed")
+    args = ap.parse_args(argv)
+
+    index = FindingsIndex()
+    if args.command == "import":
+        started = time.time()
+        count = import_results(args.results, index)
+        print(f"Indexed {count} contracts in {time.time() - started:.1f}s", file=sys.stderr)
+        return 0
+    if args.command == "stats":
+        print(json.dumps(index.stats()))
+        return 0
+    docs = index.documents(args.query, args.risk, args.limit)
+    if args.json:
+        print(json.dumps(docs, indent=2))
+        return 0
+    for doc in docs:
+        print(doc["name"])
+        for f in doc["findings"]:
+            print(f"    [{f['risk']}] {f['title']}")
+    print(f"{len(docs)} contracts", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""
+Persistent job queue and worker processes for the heavy work behind the UI.
+
+    python job_queue.py worker --workers 4      # run workers next to the app
+    python job_queue.py submit contract.pdf     # queue an analysis, prints the job id
+    python job_queue.py status <job id>
+
+Jobs live in a SQLite table, so they survive browser reconnects and app
+restarts; any process pointed at the same LEXISAFE_CACHE_DIR can submit, work
+on or poll them. Workers requeue jobs whose worker stopped sending heartbeats.
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from multiprocessing import get_context
+
+from analysis_cache import CACHE_DIR, get_cache, hash_bytes
+from metrics import span
+from utils import get_pdf_text_with_pages, stream_contract_analysis, cached_clause_findings, analysis_version, MODEL_NAME
+from compaction import compaction_version
+from risk_parser import RiskStreamParser
+from versions import version_snapshot
+from scheduler import configure, RPM_LIMIT, TPM_LIMIT
+from findings_index import get_findings_index
+
+# --- JOB QUEUE CONFIG ---
+JOBS_ENABLED = os.getenv("LEXISAFE_JOBS", "off").lower() in ("1", "on", "true", "yes")
+JOB_WORKERS = int(os.getenv("LEXISAFE_JOB_WORKERS", "2"))  # started by the app; 0 = run them separately
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")
+POLL_SECONDS = 0.5
+STALE_SECONDS = 300      # a running job without a heartbeat for this long is requeued
+MAX_ATTEMPTS = 3
+PROGRESS_EVERY = 1.0     # seconds between progress writes while a job streams
+JOB_TTL = float(os.getenv("LEXISAFE_JOB_TTL_HOURS", "24")) * 3600  # finished jobs and their files are kept this long
+PRUNE_EVERY = 300        # seconds between a worker's prune passes
+
+class JobQueue:
+    """
+    SQLite-backed queue. A job moves queued -> running -> done | error and keeps
+    its progress (0-1), a status message and a JSON result, which holds partial
+    results while the job runs.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(JOBS_DIR, exist_ok=True)
+            path = os.path.join(JOBS_DIR, "jobs.sqlite3")
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+                "progress REAL NOT NULL DEFAULT 0, message TEXT NOT NULL DEFAULT '', "
+                "payload TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "worker TEXT, created REAL NOT NULL, started REAL, finished REAL, heartbeat REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def submit(self, kind, payload):
+        if kind not in TASKS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, kind, status, payload, created) VALUES (?, ?, 'queued', ?, ?)",
+                         (job_id, kind, json.dumps(payload), time.time()))
+        return job_id
+
+    def get(self, job_id):
+        """
+        The job as a dict (payload and result decoded), or None for an unknown id.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def claim(self, worker):
+        """
+        Atomically takes the oldest queued job for this worker, or returns None.
+        Stale running jobs are put back in the queue (or failed after MAX_ATTEMPTS) first.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE jobs SET status = 'error', error = 'Worker stopped responding', finished = ? "
+                         "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                         (now, now - STALE_SECONDS, MAX_ATTEMPTS))
+            conn.execute("UPDATE jobs SET status = 'queued', worker = NULL "
+                         "WHERE status = 'running' AND heartbeat < ?", (now - STALE_SECONDS,))
+            row = conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', worker = ?, started = ?, heartbeat = ?, "
+                             "attempts = attempts + 1 WHERE id = ?", (worker, now, now, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return self.get(row["id"]) if row is not None else None
+
+    def progress(self, job_id, progress, message="", partial=None):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET progress = ?, message = ?, heartbeat = ?, "
+                         "result = COALESCE(?, result) WHERE id = ?",
+                         (progress, message, time.time(),
+                          json.dumps(partial) if partial is not None else None, job_id))
+
+    def heartbeat(self, job_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), job_id))
+
+    def finish(self, job_id, result):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'done', progress = 1, message = '', result = ?, finished = ? "
+                         "WHERE id = ?", (json.dumps(result), time.time(), job_id))
+
+    def fail(self, job_id, error):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'error', error = ?, finished = ? WHERE id = ?",
+                         (error, time.time(), job_id))
+
+    def prune(self, ttl=JOB_TTL):
+        """
+        Deletes jobs finished more than ttl seconds ago, with any upload they
+        still hold; returns how many were removed.
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, payload FROM jobs WHERE status IN ('done', 'error') "
+                                "AND finished < ?", (time.time() - ttl,)).fetchall()
+            for row in rows:
+                path = _upload_path(row["payload"])
+                if path:
+                    _remove(path)
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
+        return len(rows)
+
+def _upload_path(payload):
+    value = json.loads(payload) if payload else None
+    # Only files this queue wrote
+    if isinstance(value, dict) and isinstance(value.get("path"), str) \
+            and os.path.dirname(os.path.abspath(value["path"])) == os.path.abspath(JOBS_DIR):
+        return value["path"]
+    return None
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def store_upload(name, data):
+    """
+    Saves uploaded bytes where worker processes can read them; returns the payload for a job.
+    Each upload gets its own file, deleted once its analysis finishes.
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    doc_hash = hash_bytes(data)
+    path = os.path.join(JOBS_DIR, f"{doc_hash}.{uuid.uuid4().hex[:12]}.pdf")
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+    return {"name": name, "path": path, "sha256": doc_hash}
+
+# --- TASKS ---
+# Each task takes (payload, report) and returns a JSON-serialisable result;
+# report(progress, message, partial=None) updates the job row.
+
+def _analyze(payload, report):
+    cache, doc_hash = get_cache(), payload["sha256"]
+    risks = cache.get_risks(doc_hash, analysis_version(), MODEL_NAME)
+    report(0.05, "Extracting text")
+    text = cache.get_text(doc_hash, compaction_version())
+    if text is None:
+        text, offsets = get_pdf_text_with_pages(payload["path"])
+        if text.startswith("Error reading PDF"):
+            raise RuntimeError(text)
+        cache.put_text(doc_hash, compaction_version(), text)
+        # Page offsets for the app's dashboard
+        cache.put_pages(doc_hash, compaction_version(), offsets)
+    if risks is not None:
+        return {"risks": risks, "parse_report": {"malformed": 0, "errors": []},
+                "snapshot": version_snapshot(payload["name"], text, risks, cached_clause_findings(text))}
+
+    report(0.2, "Analyzing")
+    parser, findings = RiskStreamParser(), {}
+    last = 0.0
+    for piece in stream_contract_analysis(text, carried=payload.get("carried"), findings=findings):
+        if parser.feed(piece) and time.time() - last > PROGRESS_EVERY:
+            last = time.time()
+            n = sum(len(v) for v in parser.risks.values())
+            report(0.2, f"Analyzing... {n} findings so far", {"risks": parser.risks})
+    parser.close()
+    if not parser.errors:
+        cache.put_risks(doc_hash, analysis_version(), MODEL_NAME, parser.risks)
+    # The worker indexes its own results, so jobs submitted outside the app are searchable too
+    get_findings_index().add(doc_hash, payload["name"], parser.risks)
+    return {
+        "risks": parser.risks,
+        "parse_report": {"malformed": len(parser.malformed), "errors": parser.errors},
+        "snapshot": version_snapshot(payload["name"], text, parser.risks, findings),
+    }
+
+TASKS = {"analyze": _analyze}
+
+def run_job(queue, job):
+    """
+    Runs one claimed job to completion, recording its result or error.
+    """
+    def report(progress, message="", partial=None):
+        queue.progress(job["id"], progress, message, partial)
+
+    payload = job["payload"]
+    try:
+        with span(f"job_{job['kind']}"):
+            result = TASKS[job["kind"]](payload, report)
+    except Exception as e:
+        queue.fail(job["id"], str(e) or type(e).__name__)
+    else:
+        queue.finish(job["id"], result)
+    if job["kind"] == "analyze":
+        # Text and results are cached by then; the upload is not needed again
+        _remove(payload["path"])
+
+def worker_loop(path=None, share=1, stop=None, parent=None):
+    """
+    Claims and runs jobs until stop is set or, for embedded workers, the parent process exits.
+    share is this process's fraction of the Gemini rate limits.
+    """
+    configure(rpm=max(1, int(RPM_LIMIT * share)), tpm=max(1, int(TPM_LIMIT * share)))
+    queue = JobQueue(path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    pruned = 0.0
+    while not (stop and stop.is_set()) and (parent is None or os.getppid() == parent):
+        if time.time() - pruned > PRUNE_EVERY:
+            pruned = time.time()
+            queue.prune()
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(POLL_SECONDS)
+            continue
+        # Heartbeats keep long single calls from looking stale
+        beating = threading.Event()
+        def beat(job_id=job["id"]):
+            while not beating.wait(STALE_SECONDS / 4):
+                queue.heartbeat(job_id)
+        threading.Thread(target=beat, daemon=True).start()
+        try:
+            run_job(queue, job)
+        finally:
+            beating.set()
+
+def start_workers(count, path=None):
+    """
+    Starts count worker processes that exit with this process; returns them.
+    """
+    # spawn, not fork: the Streamlit server is multi-threaded. Not daemonic, so
+    # workers can still use the parallel PDF extractor's own process pool.
+    ctx = get_context("spawn")
+    procs = []
+    for _ in range(count):
+        proc = ctx.Process(target=worker_loop, args=(path, 1 / count, None, os.getpid()))
+        proc.start()
+        procs.append(proc)
+    return procs
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """
+    Returns the process-wide queue handle, opening it on first use.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="LexiSafe job queue: run workers, submit or inspect jobs.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    w = sub.add_parser("worker", help="run worker processes until interrupted")
+    w.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1))
+    s = sub.add_parser("submit", help="queue an analysis of a PDF and print its job id")
+    s.add_argument("pdf")
+    st_ = sub.add_parser("status", help="print a job as JSON")
+    st_.add_argument("job_id")
+    args = ap.parse_args(argv)
+
+    if args.command == "worker":
+        procs = start_workers(args.workers)
+        print(f"{len(procs)} workers polling {get_job_queue().path}", file=sys.stderr)
+        try:
+            for proc in procs:
+                proc.join()
+        except KeyboardInterrupt:
+            for proc in procs:
+                proc.terminate()
+        return 0
+    if args.command == "submit":
+        with open(args.pdf, "rb") as fh:
+            payload = store_upload(os.path.basename(args.pdf), fh.read())
+        print(get_job_queue().submit("analyze", payload))
+        return 0
+    job = get_job_queue().get(args.job_id)
+    if job is None:
+        print(f"Unknown job: {args.job_id}", file=sys.stderr)
+        return 1
+    print(json.dumps(job, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import os
+import threading
+from dotenv import load_dotenv
+from llm_replay import wrap
+
+# --- CONFIG (read once per process) ---
+load_dotenv()
+
+API_KEY = os.getenv("GOOGLE_API_KEY")
+DEFAULT_MODEL = os.getenv("LEXISAFE_MODEL", "gemini-flash-latest")
+# Point at a local fake endpoint for testing; unset means the real Gemini API
+BASE_URL = os.getenv("LEXISAFE_GEMINI_BASE_URL") or None
+
+# Keep-alive pool shared by every Gemini client in the process
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE = 32
+KEEPALIVE_SECONDS = 60
+
+_clients = {}
+_transport = None
+_lock = threading.Lock()
+
+def _shared_transport():
+    global _transport
+    if _transport is None:
+        import httpx
+        _transport = httpx.HTTPTransport(limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_SECONDS,
+        ))
+    return _transport
+
+def _build(model, temperature):
+    # Imported here so `import app` doesn't pay for the Gemini SDK until the first call
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # Sync-only: the app never uses the async client, which would reject this transport.
+    # max_retries=1 is a single attempt: scheduler.RequestScheduler owns retries and backoff.
+    return ChatGoogleGenerativeAI(
+        model=model,
+        api_key=API_KEY,
+        temperature=temperature,
+        base_url=BASE_URL,
+        max_retries=1,
+        client_args={"transport": _shared_transport()}
+    )
+
+def get_llm(model=None, temperature=0.1):
+    """
+    Returns the chat model for (model, temperature), building it on first use.
+    Every client shares one pooled HTTP transport, so concurrent calls reuse
+    kept-alive connections instead of opening fresh ones. LEXISAFE_LLM_MODE
+    swaps in a recording, replaying or fake model (see llm_replay).
+    """
+    key = (model or DEFAULT_MODEL, temperature)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = wrap(_build, *key)
+    return client
@@ -0,0 +1,256 @@
+"""
+Record/replay and fake backends for the chat model, so the pipeline can run
+and be profiled without network.
+
+    LEXISAFE_LLM_MODE=record python batch.py contracts/   # call Gemini and save every response
+    LEXISAFE_LLM_MODE=replay python batch.py contracts/   # serve the saved responses offline
+    LEXISAFE_LLM_MODE=fake streamlit run app.py           # deterministic canned records
+
+Recordings ("cassettes") are keyed by a hash of model, temperature and the
+rendered prompt, and keep the response with the latency it was observed at.
+Replay waits that long again (times LEXISAFE_LLM_LATENCY_SCALE, 0 for instant),
+so a slow run can be reproduced. LEXISAFE_LLM_LATENCY, _JITTER and _ERROR_RATE
+inject extra delay and synthetic 429s in any mode, live included.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from analysis_cache import CACHE_DIR
+from metrics import inc, estimate_tokens
+
+# --- LLM BACKEND CONFIG ---
+LLM_MODE = os.getenv("LEXISAFE_LLM_MODE", "live").lower()   # live | record | replay | fake
+MODES = ("live", "record", "replay", "fake")
+CASSETTE_DIR = os.getenv("LEXISAFE_CASSETTE_DIR", os.path.join(CACHE_DIR, "cassettes"))
+LATENCY_SCALE = float(os.getenv("LEXISAFE_LLM_LATENCY_SCALE", "1"))  # replayed latency multiplier
+EXTRA_LATENCY = float(os.getenv("LEXISAFE_LLM_LATENCY", "0"))       # seconds added to every call
+JITTER = float(os.getenv("LEXISAFE_LLM_JITTER", "0"))               # +/- seconds, uniform
+ERROR_RATE = float(os.getenv("LEXISAFE_LLM_ERROR_RATE", "0"))       # share of calls failed with a 429
+SEED = int(os.getenv("LEXISAFE_LLM_SEED", "0"))                     # makes injected jitter/errors repeatable
+STREAM_CHUNKS = 4     # pieces a canned reply is streamed in
+
+def injection_enabled():
+    return bool(EXTRA_LATENCY or JITTER or ERROR_RATE)
+
+# --- FAKE MODEL ---
+CLAUSE_ID = re.compile(r"\[C(\d+)\]")
+RISKS = ("High", "Medium", "Low")
+
+def fake_reply(prompt):
+    """
+    The fake model's answer: id-tagged records for clause batches, plain
+    records for whole-document windows, and fixed text for chat, summaries and
+    emails. The same prompt always gets the same reply.
+    """
+    ids = CLAUSE_ID.findall(prompt)
+    if ids:
+        return "\n###\n".join(
+            f"C{i} | Finding {i} | {RISKS[int(i) % 3]} | Clause {i} shifts risk onto you. | Negotiate clause {i}."
+            for i in ids) + "\n###"
+    if "negotiation email" in prompt:
+        return "Subject: Contract Review\n\nDear Team,\n\nWe propose the changes listed below.\n\nLegal Team"
+    if "running summary" in prompt:
+        return "The user asked about termination and liability."
+    if "USER QUESTION" in prompt:
+        return "The contract allows termination with 30 days' notice; liability is not capped."
+    return "\n###\n".join(f"Finding {n} | {RISKS[n % 3]} | Explanation {n}. | Fix {n}." for n in range(3)) + "\n###"
+
+# --- CASSETTES ---
+class InjectedError(Exception):
+    """
+    Synthetic rate-limit failure; scheduler.retry_after treats it as a 429.
+    """
+    code = 429
+
+class CassetteMiss(LookupError):
+    """
+    Replay found no recording for a prompt. Not retried.
+    """
+    code = 404
+
+def prompt_key(model, temperature, prompt):
+    return hashlib.sha256(json.dumps([model, temperature, prompt]).encode("utf-8")).hexdigest()
+
+class CassetteStore:
+    """
+    One JSON file per recorded call, {key[:2]}/{key}.json, holding the prompt,
+    the response, the total latency and the time to the first streamed token.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CASSETTE_DIR
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._file(key), encoding="utf-8") as fh:
+                record = json.load(fh)
+        except (OSError, ValueError):
+            inc("cache_requests_total", cache="cassette", result="miss")
+            return None
+        inc("cache_requests_total", cache="cassette", result="hit")
+        return record
+
+    def put(self, key, record):
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(record, fh, indent=1)
+        os.replace(tmp, path)
+        inc("cassettes_recorded_total")
+
+# --- BACKEND ---
+_rng = random.Random(SEED)
+_rng_lock = threading.Lock()
+
+def _inject():
+    """
+    Injected delay for one call, or raises InjectedError for error_rate of them.
+    """
+    with _rng_lock:
+        failed = _rng.random() < ERROR_RATE
+        jitter = _rng.uniform(-JITTER, JITTER) if JITTER else 0.0
+    if failed:
+        inc("llm_injected_errors_total")
+        raise InjectedError("429 RESOURCE_EXHAUSTED (injected)")
+    return max(EXTRA_LATENCY + jitter, 0.0)
+
+def _prompt_text(messages):
+    return "\n".join(m.content if isinstance(m.content, str) else json.dumps(m.content) for m in messages)
+
+def _usage(prompt, text):
+    prompt_tokens, response_tokens = estimate_tokens(prompt), estimate_tokens(text)
+    return {"input_tokens": prompt_tokens, "output_tokens": response_tokens,
+            "total_tokens": prompt_tokens + response_tokens}
+
+def _pieces(text, count=STREAM_CHUNKS):
+    step = max(-(-len(text) // count), 1)
+    return [text[i:i + step] for i in range(0, len(text), step)] or [""]
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Chat model standing in for Gemini according to mode: live passes calls
+    through (with any injection), record passes them through and saves each
+    response, replay serves saved responses and fake answers with fake_reply().
+    """
+    mode: str
+    model: str
+    temperature: float
+    live: Optional[Any] = None
+    store: Optional[Any] = None
+
+    @property
+    def _llm_type(self):
+        return f"lexisafe-{self.mode}"
+
+    def _key(self, prompt):
+        return prompt_key(self.model, self.temperature, prompt)
+
+    def _canned(self, prompt):
+        """
+        (text, latency, first_token) for replay and fake; the latencies are before injection.
+        """
+        if self.mode == "fake":
+            return fake_reply(prompt), 0.0, 0.0
+        record = self.store.get(self._key(prompt))
+        if record is None:
+            raise CassetteMiss(f"no recording for this prompt under {self.store.path}; record it with LEXISAFE_LLM_MODE=record")
+        return (record["response"], record["latency"] * LATENCY_SCALE,
+                record.get("first_token", record["latency"]) * LATENCY_SCALE)
+
+    def _save(self, prompt, text, latency, first_token):
+        self.store.put(self._key(prompt), {
+            "model": self.model, "temperature": self.temperature, "prompt": prompt,
+            "response": text, "latency": round(latency, 4), "first_token": round(first_token, 4),
+        })
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = _prompt_text(messages)
+        delay = _inject()
+        if self.mode in ("live", "record"):
+            time.sleep(delay)
+            started = time.perf_counter()
+            # No callbacks: the outer run already reports this call to LLMMetrics
+            message = self.live.invoke(messages, stop=stop, config={"callbacks": []}, **kwargs)
+            if self.mode == "record":
+                latency = time.perf_counter() - started
+                self._save(prompt, message.text, latency, latency)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        text, latency, _ = self._canned(prompt)
+        time.sleep(latency + delay)
+        return ChatResult(generations=[ChatGeneration(
+            message=AIMessage(content=text, usage_metadata=_usage(prompt, text)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = _prompt_text(messages)
+        delay = _inject()
+        if self.mode in ("live", "record"):
+            time.sleep(delay)
+            started = time.perf_counter()
+            first_token, parts = None, []
+            for chunk in self.live.stream(messages, stop=stop, config={"callbacks": []}, **kwargs):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                parts.append(chunk.text)
+                out = ChatGenerationChunk(message=chunk)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=out)
+                yield out
+            if self.mode == "record":
+                latency = time.perf_counter() - started
+                self._save(prompt, "".join(parts), latency, latency if first_token is None else first_token)
+            return
+
+        text, latency, first_token = self._canned(prompt)
+        pieces = _pieces(text)
+        time.sleep(first_token + delay)
+        gap = max(latency - first_token, 0.0) / max(len(pieces) - 1, 1)
+        for n, piece in enumerate(pieces):
+            if n:
+                time.sleep(gap)
+            last = n == len(pieces) - 1
+            out = ChatGenerationChunk(message=AIMessageChunk(
+                content=piece, usage_metadata=_usage(prompt, text) if last else None))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=out)
+            yield out
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_cassette_store():
+    """
+    Returns the process-wide cassette store, opening it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CassetteStore()
+        return _store
+
+def wrap(build, model, temperature):
+    """
+    The chat model get_llm should hand out for (model, temperature) in the
+    configured mode; build(model, temperature) makes the live client, and is
+    only called when the mode needs one.
+    """
+    if LLM_MODE not in MODES:
+        raise ValueError(f"LEXISAFE_LLM_MODE must be one of {', '.join(MODES)}, not {LLM_MODE!r}")
+    if LLM_MODE == "live" and not injection_enabled():
+        return build(model, temperature)
+    live = build(model, temperature) if LLM_MODE in ("live", "record") else None
+    store = get_cassette_store() if LLM_MODE in ("record", "replay") else None
+    return ReplayChatModel(mode=LLM_MODE, model=model, temperature=temperature, live=live, store=store)
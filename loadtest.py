@@ -0,0 +1,348 @@
+"""
+Load test: simulated reviewers driving app.py concurrently against a fake Gemini.
+
+    python loadtest.py                                   # 1, 5 and 10 concurrent sessions
+    python loadtest.py --sessions 1,10,25,50 --llm-latency 1.5 --json loadtest.json
+    python loadtest.py --shared-doc                      # every session uploads the same contract
+
+Each session is a streamlit.testing AppTest running the real app.py, all in
+this process so they share its caches, thread pools and request scheduler the
+way browser sessions share one server. A session uploads a contract, runs the
+assessment, opens the chat and asks questions, drafts the email and exports
+the report. Gemini is replaced by a local HTTP stand-in (LEXISAFE_GEMINI_BASE_URL)
+that answers every prompt like llm_replay's fake model, after a configurable delay.
+
+For each concurrency level it prints p50/p95/p99 per step, sessions per
+minute and the process's resident memory. No API key or network is needed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+STEPS = ("upload", "assessment", "chat_open", "chat_question", "email", "report")
+QUESTIONS = ("What is the termination notice period?", "Is liability capped anywhere?")
+PERCENTILES = (50, 95, 99)
+RUN_TIMEOUT = 300      # seconds one app rerun may take before the step fails
+
+# --- FAKE GEMINI ---
+class FakeGemini(ThreadingHTTPServer):
+    """
+    Serves generateContent and streamGenerateContent (SSE) on 127.0.0.1.
+    Each call waits latency seconds, +/- jitter; error_rate is the share of calls
+    answered with a 429, which the app's scheduler retries.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.5, jitter=0.2, error_rate=0.0, chunks=4):
+        super().__init__(("127.0.0.1", 0), _FakeGeminiHandler)
+        self.latency, self.jitter, self.error_rate, self.chunks = latency, jitter, error_rate, chunks
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def delay(self):
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0)
+
+class _FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "".join(part.get("text", "") for content in request.get("contents", [])
+                         for part in content.get("parts", []))
+        with server._lock:
+            server.calls += 1
+        if random.random() < server.error_rate:
+            error = {"error": {"code": 429, "message": "Resource exhausted", "status": "RESOURCE_EXHAUSTED"}}
+            return self._send(429, json.dumps(error).encode())
+
+        # Imported on first use: llm_replay reads the cache dir main() sets up
+        from llm_replay import fake_reply
+        text, delay = fake_reply(prompt), server.delay()
+        tokens = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4,
+                  "totalTokenCount": (len(prompt) + len(text)) // 4}
+        if ":streamGenerateContent" not in self.path:
+            time.sleep(delay)
+            return self._send(200, json.dumps(_candidate(text, tokens)).encode())
+
+        # Half the delay before the first chunk, the rest spread over the others
+        step = max(len(text) // server.chunks, 1)
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        events = [b"data: " + json.dumps(_candidate(piece, tokens if n == len(pieces) - 1 else None)).encode() + b"\r\n\r\n"
+                  for n, piece in enumerate(pieces)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(sum(len(e) for e in events)))
+        self.end_headers()
+        time.sleep(delay / 2)
+        for n, event in enumerate(events):
+            if n:
+                time.sleep(delay / 2 / (len(events) - 1))
+            self.wfile.write(event)
+            self.wfile.flush()
+
+def _candidate(text, tokens=None):
+    out = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                           "index": 0, **({"finishReason": "STOP"} if tokens else {})}]}
+    if tokens:
+        out["usageMetadata"] = tokens
+    return out
+
+# --- CONTRACTS ---
+CLAUSES = (
+    "TERM. This Agreement starts on the Effective Date and renews automatically for successive one-year terms.",
+    "FEES. The Customer shall pay all invoices within thirty days. Late amounts accrue interest at two percent per month.",
+    "LIABILITY. The Supplier's total liability under this Agreement is unlimited and includes indirect damages.",
+    "TERMINATION. Either party may terminate this Agreement for material breach not cured within fifteen days.",
+    "DATA. The Supplier may share aggregated usage data with its affiliates and selected partners.",
+    "CONFIDENTIALITY. Each party shall keep the other's confidential information secret for five years.",
+    "GOVERNING LAW. This Agreement is governed by the laws of the State of Delaware.",
+    "ASSIGNMENT. The Customer may not assign this Agreement without the Supplier's prior written consent.",
+)
+
+def contract_pdf(party):
+    """
+    A small multi-page contract; the party name makes every clause, and so the
+    document and clause hashes, unique to it.
+    """
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_font("Arial", size=11)
+    for page in range(2):
+        pdf.add_page()
+        for n, clause in enumerate(CLAUSES, start=1):
+            pdf.multi_cell(0, 6, f"{page * len(CLAUSES) + n}. {clause} This clause binds {party}.")
+            pdf.ln(3)
+    return pdf.output(dest="S").encode("latin-1")
+
+# --- SESSIONS ---
+def _shared_runtime():
+    """
+    AppTest installs a fresh mock Runtime for each run and removes it afterwards,
+    which breaks runs that overlap. Sessions here share one mock runtime instead,
+    as browser sessions share the real one, and each AppTest writes its own to a
+    private subclass where nothing reads it. Each AppTest also gets its own
+    session id, so one session's finished run can't drop another's downloads,
+    and all of them share one script cache, as the server's sessions do.
+    """
+    from unittest.mock import MagicMock
+    import streamlit.testing.v1.app_test as app_test
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    script_cache = ScriptCache()
+
+    class PerSessionRunner(LocalScriptRunner):
+        def __init__(self, script_path, session_state, *args, **kwargs):
+            super().__init__(script_path, session_state, *args, **kwargs)
+            # session_state belongs to one AppTest and lives as long as it does
+            self._session_id = f"loadtest-{id(session_state):x}"
+            self._script_cache = script_cache
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    app_test.Runtime = type("PerRunRuntime", (Runtime,), {"_instance": None})
+    app_test.LocalScriptRunner = PerSessionRunner
+    return runtime
+
+class SessionError(Exception):
+    pass
+
+def _run(at, step):
+    # at may be a widget with a pending value; its run() returns the AppTest
+    at = at.run(timeout=RUN_TIMEOUT)
+    if at.exception:
+        raise SessionError(f"{step}: {at.exception[0].message}")
+    return at
+
+def _button(at, label):
+    for button in at.button:
+        if label in button.label:
+            return button
+    raise SessionError(f"no '{label}' button")
+
+def run_session(name, pdf, questions, record):
+    """
+    One reviewer's visit; record(step, seconds) is called as each step completes.
+    Returns None, or the error that ended the session.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    def timed(step, action):
+        started = time.perf_counter()
+        action()
+        record(step, time.perf_counter() - started)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+    try:
+        _run(at, "load")
+        at.sidebar.file_uploader[0].upload(name, pdf, "application/pdf")
+        timed("upload", lambda: _run(at, "upload"))
+        timed("assessment", lambda: _run(_button(at, "RUN RISK ASSESSMENT").click(), "assessment"))
+        if not at.session_state["analysis_done"]:
+            raise SessionError("assessment did not finish")
+        timed("chat_open", lambda: _run(_button(at, "AI Chat Assistant").click(), "chat_open"))
+        for question in questions:
+            timed("chat_question", lambda: _run(at.chat_input[0].set_value(question), "chat_question"))
+        timed("email", lambda: (_run(_button(at, "Email Drafter").click(), "email"),
+                                _run(_button(at, "Draft Now").click(), "email")))
+        if not at.session_state["email_draft"]:
+            raise SessionError("no email draft")
+        timed("report", lambda: _export_report(at))
+    except Exception as e:
+        return e
+    return None
+
+def _export_report(at):
+    # A click in the browser runs the button's deferred callable on the server; do the same
+    from streamlit.runtime import Runtime
+    _run(at.download_button[0].click(), "report")
+    file_id = at.download_button[0].proto.deferred_file_id
+    if not file_id:
+        raise SessionError("report: nothing to download")
+    Runtime._instance.media_file_mgr.execute_deferred(file_id)
+
+# --- MEASUREMENT ---
+def rss_bytes():
+    """
+    Resident memory of this process; peak RSS where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    ordered = sorted(values)
+    return ordered[max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0) if p < 100 else -1]
+
+def run_level(concurrency, docs, questions):
+    """
+    Runs concurrency sessions at once; returns the level's timings, errors and memory.
+    """
+    timings = {step: [] for step in STEPS}
+    lock = threading.Lock()
+    def record(step, seconds):
+        with lock:
+            timings[step].append(seconds)
+
+    peak, sampling = [rss_bytes()], threading.Event()
+    def sample():
+        while not sampling.wait(0.2):
+            peak.append(rss_bytes())
+    threading.Thread(target=sample, daemon=True).start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        errors = [e for e in pool.map(lambda d: run_session(d[0], d[1], questions, record), docs) if e]
+    wall = time.perf_counter() - started
+    sampling.set()
+    return {
+        "concurrency": concurrency,
+        "sessions": len(docs),
+        "errors": [str(e) or type(e).__name__ for e in errors],
+        "seconds": round(wall, 3),
+        "sessions_per_minute": round((len(docs) - len(errors)) / wall * 60, 2),
+        "rss_mb": round(rss_bytes() / 2**20, 1),
+        "peak_rss_mb": round(max(peak) / 2**20, 1),
+        "steps": {
+            step: {f"p{p}": round(percentile(v, p), 3) for p in PERCENTILES} | {"count": len(v)}
+            for step, v in timings.items() if v
+        },
+    }
+
+def print_level(result):
+    print(f"\n== {result['concurrency']} concurrent sessions: {result['sessions_per_minute']} sessions/min, "
+          f"{len(result['errors'])} errors, RSS {result['rss_mb']} MB (peak {result['peak_rss_mb']} MB)")
+    print(f"{'step':<15}{'count':>7}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES))
+    for step, s in result["steps"].items():
+        print(f"{step:<15}{s['count']:>7}" + "".join(f"{s['p' + str(p)]:>9.3f}s" for p in PERCENTILES))
+    for error in result["errors"][:5]:
+        print(f"  error: {error}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Drive concurrent app sessions against a fake Gemini.")
+    ap.add_argument("--sessions", default="1,5,10", help="comma-separated concurrency levels")
+    ap.add_argument("--questions", type=int, default=len(QUESTIONS), help="chat questions per session")
+    ap.add_argument("--llm-latency", type=float, default=0.5, help="seconds per fake Gemini call")
+    ap.add_argument("--llm-jitter", type=float, default=0.2, help="+/- seconds of random latency")
+    ap.add_argument("--llm-error-rate", type=float, default=0.0, help="share of calls answered with a 429")
+    ap.add_argument("--shared-doc", action="store_true", help="all sessions upload the same contract (cache-warm)")
+    ap.add_argument("--cache-dir", help="cache directory (default: a fresh temporary one)")
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args(argv)
+    levels = [int(n) for n in args.sessions.split(",")]
+
+    fake = FakeGemini(args.llm_latency, args.llm_jitter, args.llm_error_rate).start()
+    # Read when the app's modules are first imported, so set before any of them is
+    os.environ.update({
+        "LEXISAFE_GEMINI_BASE_URL": fake.url,
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "loadtest"),
+        "LEXISAFE_CACHE_DIR": args.cache_dir or tempfile.mkdtemp(prefix="lexisafe-loadtest-"),
+        "LEXISAFE_JOBS": "off",
+        "LEXISAFE_LLM_MODE": "live",   # the stand-in is the backend under test
+    })
+    _shared_runtime()
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.questions)]
+    results = []
+    for level, concurrency in enumerate(levels):
+        names = ["shared"] * concurrency if args.shared_doc else [f"L{level}S{i}" for i in range(concurrency)]
+        docs = [(f"contract_{n}.pdf", contract_pdf(f"Party {n}")) for n in names]
+        result = run_level(concurrency, docs, questions)
+        result["llm_calls"] = fake.calls
+        results.append(result)
+        print_level(result)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"llm_latency": args.llm_latency, "levels": results}, fh, indent=2)
+    fake.shutdown()
+    return 1 if any(r["errors"] for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+from metrics import estimate_tokens
+
+# --- MEMORY CONFIG ---
+MAX_TURNS = 6          # verbatim turns kept before folding into the summary
+KEEP_TURNS = 4         # verbatim turns left after a fold, so folds happen in batches
+TOKEN_BUDGET = 1500    # ceiling for the rendered history (summary + recent turns)
+SUMMARY_TOKENS = 300   # ceiling for the running summary itself
+
+def _format_turns(turns):
+    return "\n".join(f"User: {q}\nAI: {a}" for q, a in turns)
+
+def _fallback_summary(summary, turns):
+    """
+    Used when no summarizer is set or it fails: keeps just the questions asked.
+    """
+    asked = "; ".join(q.strip().replace("\n", " ")[:120] for q, _ in turns)
+    return f"{summary}\nEarlier the user asked: {asked}".strip()
+
+class ConversationMemory:
+    """
+    Chat history with a fixed token budget: the last few turns verbatim and
+    everything older folded into a running summary. Each fold only summarizes
+    the turns being evicted together with the previous summary, never the
+    whole conversation.
+
+    summarizer(previous_summary, turns_text) -> new summary
+    """
+
+    def __init__(self, summarizer=None, max_turns=MAX_TURNS, keep_turns=KEEP_TURNS,
+                 token_budget=TOKEN_BUDGET, summary_tokens=SUMMARY_TOKENS):
+        self.summarizer = summarizer
+        self.max_turns = max_turns
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.turns = []
+
+    def add_turn(self, question, answer):
+        self.turns.append((question, answer))
+        evicted = []
+        if len(self.turns) > self.max_turns:
+            cut = len(self.turns) - self.keep_turns
+            evicted, self.turns = self.turns[:cut], self.turns[cut:]
+        # Long answers can blow the budget on their own; keep at least the latest turn
+        while len(self.turns) > 1 and estimate_tokens(self.render()) > self.token_budget:
+            evicted.append(self.turns.pop(0))
+        if evicted:
+            self._fold(evicted)
+
+    def _fold(self, turns):
+        summary = None
+        if self.summarizer is not None:
+            try:
+                summary = self.summarizer(self.summary, _format_turns(turns))
+            except Exception:
+                summary = None
+        if not summary:
+            summary = _fallback_summary(self.summary, turns)
+        max_chars = self.summary_tokens * 4
+        if len(summary) > max_chars:
+            summary = summary[-max_chars:]
+        self.summary = summary.strip()
+
+    def render(self):
+        """
+        The {history} block for the chat prompt.
+        """
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation:\n{self.summary}")
+        if self.turns:
+            parts.append(_format_turns(self.turns))
+        return "\n\n".join(parts)
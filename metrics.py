@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.callbacks import BaseCallbackHandler
+
+# --- METRICS CONFIG ---
+PREFIX = "lexisafe"
+# Upper bounds (seconds) shared by every latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TRACE_MAX_EVENTS = 100000
+
+class Registry:
+    """
+    Process-wide counters, gauges, latency histograms and a bounded trace of spans.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.trace = deque(maxlen=TRACE_MAX_EVENTS)
+        self.started = time.time()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    h["buckets"][i] += 1
+            h["sum"] += value
+            h["count"] += 1
+
+    def add_event(self, name, start, duration, attrs):
+        self.trace.append({
+            "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": int((start - self.started) * 1e6), "dur": int(duration * 1e6), "args": attrs,
+        })
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+            self.trace.clear()
+            self.started = time.time()
+
+REGISTRY = Registry()
+
+def inc(name, amount=1, **labels):
+    REGISTRY.inc(name, amount, **labels)
+
+def set_gauge(name, value, **labels):
+    REGISTRY.set_gauge(name, value, **labels)
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+@contextmanager
+def span(stage, **attrs):
+    """
+    Times a pipeline stage into the stage latency histogram and the trace.
+    Exceptions are counted as errors for the stage and re-raised.
+    """
+    start = time.time()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException:
+        status = "error"
+        inc("errors_total", stage=stage)
+        raise
+    finally:
+        duration = time.time() - start
+        observe("stage_seconds", duration, stage=stage)
+        REGISTRY.add_event(stage, start, duration, {**attrs, "status": status})
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (~4 characters per token for English prose).
+    """
+    return len(text) // 4 + 1
+
+class LLMMetrics(BaseCallbackHandler):
+    """
+    LangChain callback recording latency, time to first token and token usage
+    for one call site. Pass a fresh instance per call:
+        chain.invoke(inputs, config={"callbacks": [LLMMetrics("chat", model, 0.3)]})
+    Token counts come from the response's usage metadata, or are estimated
+    from text length when the provider does not return them.
+    """
+
+    def __init__(self, call, model, temperature):
+        self.labels = {"call": call, "model": model}
+        self.temperature = temperature
+        self._runs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt = "".join(str(m.content) for batch in messages for m in batch)
+        self._runs[run_id] = {"start": time.time(), "first": None, "prompt_chars": len(prompt)}
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run and run["first"] is None:
+            run["first"] = time.time()
+            observe("llm_first_token_seconds", run["first"] - run["start"], **self.labels)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        duration = time.time() - run["start"]
+        gen = response.generations[0][0] if response.generations and response.generations[0] else None
+        usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens") or run["prompt_chars"] // 4 + 1
+        response_tokens = usage.get("output_tokens") or estimate_tokens(gen.text if gen else "")
+        observe("llm_seconds", duration, **self.labels)
+        inc("llm_requests_total", **self.labels, status="ok")
+        inc("llm_tokens_total", prompt_tokens, **self.labels, kind="prompt")
+        inc("llm_tokens_total", response_tokens, **self.labels, kind="response")
+        REGISTRY.add_event(f"llm:{self.labels['call']}", run["start"], duration, {
+            **self.labels, "temperature": self.temperature,
+            "prompt_tokens": prompt_tokens, "response_tokens": response_tokens,
+        })
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        inc("llm_requests_total", **self.labels, status="error")
+        inc("errors_total", stage=f"llm:{self.labels['call']}")
+        if run:
+            duration = time.time() - run["start"]
+            observe("llm_seconds", duration, **self.labels)
+            REGISTRY.add_event(f"llm:{self.labels['call']}", run["start"], duration, {
+                **self.labels, "temperature": self.temperature, "error": str(error)[:200],
+            })
+
+# --- EXPORT ---
+def _label_str(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"'.replace("\n", " ") for k, v in items)
+    return "{" + body + "}"
+
+def prometheus_text(registry=REGISTRY):
+    """
+    Renders all metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    with registry._lock:
+        counters = dict(registry.counters)
+        gauges = dict(registry.gauges)
+        histograms = {k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]} for k, v in registry.histograms.items()}
+
+    for name in sorted({n for n, _ in counters}):
+        lines.append(f"# TYPE {PREFIX}_{name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{PREFIX}_{name}{_label_str(labels)} {value}")
+
+    for name in sorted({n for n, _ in gauges}):
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        for (n, labels), value in sorted(gauges.items()):
+            if n == name:
+                lines.append(f"{PREFIX}_{name}{_label_str(labels)} {value}")
+
+    for name in sorted({n for n, _ in histograms}):
+        lines.append(f"# TYPE {PREFIX}_{name} histogram")
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            for bound, count in zip(LATENCY_BUCKETS, h["buckets"]):
+                lines.append(f"{PREFIX}_{name}_bucket{_label_str(labels, [('le', bound)])} {count}")
+            lines.append(f"{PREFIX}_{name}_bucket{_label_str(labels, [('le', '+Inf')])} {h['count']}")
+            lines.append(f"{PREFIX}_{name}_sum{_label_str(labels)} {h['sum']:.6f}")
+            lines.append(f"{PREFIX}_{name}_count{_label_str(labels)} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path, registry=REGISTRY):
+    """
+    Writes the metrics file atomically (for node_exporter's textfile collector).
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        fh.write(prometheus_text(registry))
+    os.replace(tmp, path)
+
+def write_trace(path, registry=REGISTRY):
+    """
+    Dumps the recorded spans as Chrome trace-event JSON (chrome://tracing, Perfetto).
+    """
+    with open(path, "w") as fh:
+        json.dump({"traceEvents": list(registry.trace)}, fh)
+
+def start_http_server(port, host="0.0.0.0", registry=REGISTRY):
+    """
+    Serves /metrics on a background thread; returns the server.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(registry).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
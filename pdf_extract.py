@@ -0,0 +1,88 @@
+import bisect
+import mmap
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pypdf import PdfReader
+
+# --- EXTRACTION CONFIG ---
+# Small documents are faster serially than paying for worker start-up
+PARALLEL_MIN_PAGES = 40
+PAGES_PER_TASK = 25
+MAX_WORKERS = os.cpu_count() or 1
+
+def _extract_page_range(path, start, stop):
+    """
+    Worker: extracts pages [start, stop) from a memory-mapped copy of the PDF.
+    """
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        reader = PdfReader(mm)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def _read_bytes(uploaded_file):
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        with open(uploaded_file, "rb") as fh:
+            return fh.read()
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    uploaded_file.seek(0)
+    return uploaded_file.read()
+
+def extract_pdf_pages(uploaded_file, workers=None):
+    """
+    Returns the text of every page, in order.
+    Large documents are split into page ranges and extracted in a process pool;
+    workers=1 forces serial extraction, None picks automatically.
+    """
+    data = _read_bytes(uploaded_file)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(data)
+        path = tmp.name
+    del data
+
+    try:
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            page_count = len(PdfReader(mm).pages)
+
+        if workers is None:
+            workers = MAX_WORKERS if page_count >= PARALLEL_MIN_PAGES else 1
+        if workers <= 1 or page_count <= PAGES_PER_TASK:
+            return _extract_page_range(path, 0, page_count)
+
+        ranges = [(s, min(s + PAGES_PER_TASK, page_count)) for s in range(0, page_count, PAGES_PER_TASK)]
+        # spawn, not fork: the Streamlit server is multi-threaded
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=get_context("spawn")) as pool:
+            futures = [pool.submit(_extract_page_range, path, s, e) for s, e in ranges]
+            pages = []
+            for f in futures:
+                pages.extend(f.result())
+        return pages
+    finally:
+        os.remove(path)
+
+def join_pages(pages):
+    """
+    Joins page texts in one pass, skipping empty pages as get_pdf_text always has.
+    Returns (text, offsets) where offsets is a list of
+    {"page", "start", "end"} character spans into text.
+    """
+    parts, offsets, pos = [], [], 0
+    for number, content in enumerate(pages, start=1):
+        if not content:
+            continue
+        parts.append(content)
+        parts.append("\n")
+        offsets.append({"page": number, "start": pos, "end": pos + len(content)})
+        pos += len(content) + 1
+    return "".join(parts), offsets
+
+def page_for_offset(offsets, pos):
+    """
+    Maps a character position in the joined text back to its 1-based page number.
+    """
+    if not offsets:
+        return None
+    starts = [o["start"] for o in offsets]
+    i = max(bisect.bisect_right(starts, pos) - 1, 0)
+    return offsets[i]["page"]
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import re
+from metrics import inc
+
+# --- PRE-SCREEN CONFIG ---
+# Well-known clause patterns are classified locally; only the rest of the text goes to the model.
+PRESCREEN_ENABLED = os.getenv("LEXISAFE_PRESCREEN", "on").lower() not in ("0", "off", "false", "no")
+RULES_PATH = os.getenv("LEXISAFE_PRESCREEN_RULES",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "prescreen_rules.json"))
+
+# Sentence ends, clause separators and blank lines
+SENTENCE_BREAK = re.compile(r"(?<=[.;!?])\s+|\n\s*\n")
+WORD = re.compile(r"[^\W\d_]{2}")
+
+def _word_list(words):
+    # Whole words or phrases, any case
+    if not words:
+        return None
+    return re.compile(r"\b(?:" + "|".join(re.escape(w) for w in words) + r")\b", re.I)
+
+class RuleSet:
+    """
+    A list of clause rules compiled into a single alternation, so each
+    sentence is scanned once no matter how many rules there are.
+
+    Each rule is a dict with id, title, risk (High/Medium/Low), patterns
+    (regular expressions, matched case-insensitively), explanation and fix.
+    Sentences that also contain a qualifier ("unless", "subject to", ...) or a
+    negator ("not", "never", "in no event", ...) are treated as ambiguous and
+    left for the model: "shall not sell customer data" is protective, not a risk.
+    """
+
+    def __init__(self, rules, qualifiers=(), negators=()):
+        self.rules = list(rules)
+        alternatives = [
+            f"(?P<r{i}>{'|'.join(f'(?:{p})' for p in rule['patterns'])})"
+            for i, rule in enumerate(self.rules) if rule.get("patterns")
+        ]
+        self.pattern = re.compile("|".join(alternatives), re.I) if alternatives else None
+        self.qualifiers = _word_list(qualifiers)
+        self.negators = _word_list(negators)
+        payload = json.dumps({"rules": self.rules, "qualifiers": list(qualifiers),
+                              "negators": list(negators)}, sort_keys=True)
+        self.fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(data.get("rules", []), data.get("qualifiers", []), data.get("negators", []))
+
+    def match(self, sentence):
+        """
+        Rules that fire on a sentence, or None when the sentence is ambiguous.
+        """
+        if self.pattern is None:
+            return []
+        hits = []
+        for m in self.pattern.finditer(sentence):
+            rule = self.rules[int(m.lastgroup[1:])]
+            if rule not in hits:
+                hits.append(rule)
+        if hits and any(words is not None and words.search(sentence)
+                        for words in (self.qualifiers, self.negators)):
+            return None
+        return hits
+
+    def record(self, rule):
+        # Same 'Title | Risk | Explanation | Fix' shape the model produces
+        return f"{rule['title']} | {rule['risk']} | {rule['explanation']} | {rule['fix']}"
+
+_rules = None
+
+def get_rules():
+    """
+    The process-wide rule set, loaded from RULES_PATH on first use.
+    An unreadable rules file disables the pre-screen rather than failing analysis.
+    """
+    global _rules
+    if _rules is None:
+        try:
+            _rules = RuleSet.from_file(RULES_PATH)
+        except (OSError, ValueError, re.error):
+            _rules = RuleSet([])
+    return _rules
+
+def prescreen(text, rules=None):
+    """
+    Splits text into sentences and classifies those matching a rule locally.
+
+    Returns (records, remainder): records is a '###'-separated string of local
+    findings (each rule reported once), remainder is the text of every
+    unmatched or ambiguous sentence, in order, for the model to analyze.
+    """
+    rules = rules or get_rules()
+    records, fired = [], set()
+    kept = []
+    skipped = 0
+    start = 0
+    for cut in [m for m in SENTENCE_BREAK.finditer(text)] + [None]:
+        end = cut.start() if cut else len(text)
+        sentence = text[start:end]
+        hits = rules.match(sentence) if sentence.strip() else None
+        if hits:
+            skipped += len(sentence)
+            for rule in hits:
+                if rule["id"] not in fired:
+                    fired.add(rule["id"])
+                    records.append(rules.record(rule))
+                    inc("prescreen_matches_total", rule=rule["id"])
+        else:
+            kept.append(text[start:cut.end() if cut else len(text)])
+        if cut:
+            start = cut.end()
+
+    inc("prescreen_chars_total", skipped, outcome="local")
+    inc("prescreen_chars_total", len(text) - skipped, outcome="model")
+    remainder = "".join(kept)
+    # Leftover clause numbers or punctuation are not worth a request
+    return "\n###\n".join(records), remainder if WORD.search(remainder) else ""
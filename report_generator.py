@@ -1,7 +1,64 @@
-from fpdf import FPDF
+from fpdf import FPDF, set_global
 import io
+import json
+import os
+import sys
+import tempfile
+from metrics import span
+
+# --- FONT CONFIG ---
+# Path to a TrueType font (e.g. DejaVuSans.ttf). With it, reports keep every
+# Unicode character; without it the built-in Arial is used and text is folded to Latin-1.
+UNICODE_FONT = os.getenv("LEXISAFE_REPORT_FONT") or None
+
+# pyfpdf caches TTF metrics next to the font by default; system font dirs are often read-only
+set_global("FPDF_CACHE_MODE", 2)
+set_global("FPDF_CACHE_DIR", tempfile.gettempdir())
+
+# 'Smart' punctuation and its ASCII equivalents. Chained str.replace beats
+# str.translate with a dict table here: each replace is a C-level scan.
+_ASCII_FOLD = (
+    ('\u2018', "'"),   # Left single quote
+    ('\u2019', "'"),   # Right single quote
+    ('\u201c', '"'),   # Left double quote
+    ('\u201d', '"'),   # Right double quote
+    ('\u2013', '-'),   # En dash
+    ('\u2014', '-'),   # Em dash
+    ('\u2026', '...'), # Ellipsis
+    ('\u00A0', ' '),   # Non-breaking space
+)
+
+SECTIONS = [
+    ("High", "Critical Risks (High Priority)", (255, 75, 75)),   # Red
+    ("Medium", "Warnings (Medium Priority)", (255, 165, 0)),     # Orange
+    ("Low", "Safe Clauses", (0, 180, 100)),                      # Green
+]
+
+def _bold_variant(font_path):
+    """
+    DejaVuSans.ttf -> DejaVuSans-Bold.ttf when it exists, else the regular file.
+    """
+    root, ext = os.path.splitext(font_path)
+    bold = f"{root}-Bold{ext}"
+    return bold if os.path.exists(bold) else font_path
 
 class PDFReport(FPDF):
+    def __init__(self, font_path=UNICODE_FONT):
+        super().__init__()
+        self.body_font = "Arial"
+        self.unicode = bool(font_path)
+        if font_path:
+            self.add_font("Body", "", font_path, uni=True)
+            self.add_font("Body", "B", _bold_variant(font_path), uni=True)
+            self.add_font("Body", "I", font_path, uni=True)
+            self.body_font = "Body"
+
+    def safe(self, text):
+        """
+        Text as this document can render it: untouched with a Unicode font, cleaned otherwise.
+        """
+        return str(text) if self.unicode else clean_text(text)
+
     def header(self):
         # Logo text
         self.set_font('Arial', 'B', 16)
@@ -15,6 +72,87 @@ class PDFReport(FPDF):
         self.set_text_color(128)
         self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
 
+class _PageSpool:
+    """
+    Stand-in for FPDF.pages that keeps only the open page in memory and
+    moves each finished page to a temporary file.
+    """
+
+    def __init__(self):
+        self._fh = tempfile.TemporaryFile()
+        self._index = {}
+        self._current = None
+        self._text = ""
+
+    def _flush(self):
+        if self._current is None:
+            return
+        data = self._text.encode("latin-1")
+        self._fh.seek(0, os.SEEK_END)
+        self._index[self._current] = (self._fh.tell(), len(data))
+        self._fh.write(data)
+        self._current, self._text = None, ""
+
+    def __setitem__(self, n, text):
+        if n != self._current:
+            self._flush()
+            self._current = n
+        self._text = text
+
+    def __getitem__(self, n):
+        if n == self._current:
+            return self._text
+        offset, length = self._index[n]
+        self._fh.seek(offset)
+        return self._fh.read(length).decode("latin-1")
+
+    def __contains__(self, n):
+        return n == self._current or n in self._index
+
+    def __len__(self):
+        return len(self._index) + (self._current is not None and self._current not in self._index)
+
+    def close(self):
+        self._fh.close()
+
+class _FileBuffer:
+    """
+    Stand-in for FPDF.buffer: FPDF only ever appends to it and asks its length
+    (for xref offsets), so both go straight to the output file handle.
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.size = 0
+
+    def __iadd__(self, text):
+        data = text.encode("latin-1")
+        self.fh.write(data)
+        self.size += len(data)
+        return self
+
+    def __len__(self):
+        return self.size
+
+class StreamingPDFReport(PDFReport):
+    """
+    PDFReport that writes incrementally: finished pages are spooled to disk
+    and the final document is written straight to a binary file handle, so
+    memory stays flat however many pages are rendered. Call finish() instead
+    of output().
+    """
+
+    def __init__(self, fh, font_path=UNICODE_FONT):
+        super().__init__(font_path)
+        self.pages = _PageSpool()
+        self.buffer = _FileBuffer(fh)
+
+    def finish(self):
+        try:
+            self.close()
+        finally:
+            self.pages.close()
+
 def clean_text(text):
     """
     Fixes encoding issues by replacing 'smart quotes' and unsupported characters
@@ -22,85 +160,165 @@ def clean_text(text):
     """
     if not isinstance(text, str):
         return str(text)
-        
-    replacements = {
-        '\u2018': "'",  # Left single quote
-        '\u2019': "'",  # Right single quote
-        '\u201c': '"',  # Left double quote
-        '\u201d': '"',  # Right double quote
-        '\u2013': '-',  # En dash
-        '\u2014': '-',  # Em dash
-        '\u2026': '...', # Ellipsis
-        '\u00A0': ' ',   # Non-breaking space
-    }
-    
-    for char, replacement in replacements.items():
-        text = text.replace(char, replacement)
-    
+
+    # Most findings are plain ASCII already
+    if text.isascii():
+        return text
+    for smart, plain in _ASCII_FOLD:
+        if smart in text:
+            text = text.replace(smart, plain)
     # Force convert to latin-1 compatible text, replacing unknowns with '?'
     return text.encode('latin-1', 'replace').decode('latin-1')
 
-def create_pdf_report(filename, risks):
-    """
-    Generates a professional PDF report from the risks dictionary.
-    """
-    pdf = PDFReport()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    
+def _add_section(pdf, title, items, color):
+    if not items: return
+    font = pdf.body_font
+
+    # Section Header
+    pdf.set_font(font, 'B', 12)
+    pdf.set_text_color(*color)
+    pdf.cell(0, 10, pdf.safe(title.upper()), 0, 1)
+    pdf.set_text_color(0) # Reset to black
+
+    # Items
+    pdf.set_font(font, '', 10)
+    for item in items:
+        # Clause Title
+        pdf.set_font(font, 'B', 10)
+        pdf.cell(0, 8, f"- {pdf.safe(item['title'])}", 0, 1)
+
+        # Explanation
+        pdf.set_font(font, '', 10)
+        pdf.multi_cell(0, 5, f"Analysis: {pdf.safe(item['expl'])}")
+
+        # Recommendation
+        pdf.set_font(font, 'I', 9)
+        pdf.set_text_color(80, 80, 80) # Grey
+        pdf.multi_cell(0, 5, f"Recommendation: {pdf.safe(item['fix'])}")
+
+        pdf.ln(3) # Space between items
+        pdf.set_text_color(0) # Reset
+
+    pdf.ln(5) # Space between sections
+
+def _add_contract(pdf, filename, risks):
     # --- TITLE SECTION ---
-    pdf.set_font("Arial", 'B', 12)
+    pdf.set_font(pdf.body_font, 'B', 12)
     pdf.set_text_color(0)
-    # Applying clean_text to prevent crashes
-    pdf.cell(0, 10, f"Contract Analyzed: {clean_text(filename)}", 0, 1)
+    pdf.cell(0, 10, f"Contract Analyzed: {pdf.safe(filename)}", 0, 1)
     pdf.ln(5)
-    
+
     # --- SUMMARY METRICS ---
     h, m, l = len(risks['High']), len(risks['Medium']), len(risks['Low'])
-    
-    pdf.set_font("Arial", '', 10)
+
+    pdf.set_font(pdf.body_font, '', 10)
     pdf.cell(0, 10, f"Summary: {h} Critical Risks, {m} Warnings, {l} Safe Clauses", 0, 1)
     pdf.ln(5)
-    
-    # --- RISK DETAILS FUNCTION ---
-    def add_section(title, items, color_r, color_g, color_b):
-        if not items: return
-        
-        # Section Header
-        pdf.set_font("Arial", 'B', 12)
-        pdf.set_text_color(color_r, color_g, color_b)
-        pdf.cell(0, 10, clean_text(title.upper()), 0, 1)
-        pdf.set_text_color(0) # Reset to black
-        
-        # Items
-        pdf.set_font("Arial", '', 10)
-        for item in items:
-            # Clause Title
-            pdf.set_font("Arial", 'B', 10)
-            # CLEANING TEXT HERE
-            pdf.cell(0, 8, f"- {clean_text(item['title'])}", 0, 1)
-            
-            # Explanation
-            pdf.set_font("Arial", '', 10)
-            # CLEANING TEXT HERE
-            pdf.multi_cell(0, 5, f"Analysis: {clean_text(item['expl'])}")
-            
-            # Recommendation
-            pdf.set_font("Arial", 'I', 9)
-            pdf.set_text_color(80, 80, 80) # Grey
-            # CLEANING TEXT HERE
-            pdf.multi_cell(0, 5, f"Recommendation: {clean_text(item['fix'])}")
-            
-            pdf.ln(3) # Space between items
-            pdf.set_text_color(0) # Reset
-        
-        pdf.ln(5) # Space between sections
 
     # --- ADD SECTIONS ---
-    add_section("Critical Risks (High Priority)", risks['High'], 255, 75, 75)   # Red
-    add_section("Warnings (Medium Priority)", risks['Medium'], 255, 165, 0)     # Orange
-    add_section("Safe Clauses", risks['Low'], 0, 180, 100)                      # Green
-    
-    # --- RETURN BYTES ---
-    # Latin-1 encoding will now work because we cleaned the text
-    return pdf.output(dest='S').encode('latin-1', 'replace')
\ No newline at end of file
+    for key, title, color in SECTIONS:
+        _add_section(pdf, title, risks[key], color)
+
+def create_pdf_report(filename, risks):
+    """
+    Generates a professional PDF report from the risks dictionary.
+    """
+    with span("pdf_render", findings=sum(len(v) for v in risks.values())):
+        pdf = PDFReport()
+        pdf.add_page()
+        pdf.set_auto_page_break(auto=True, margin=15)
+        _add_contract(pdf, filename, risks)
+
+        # --- RETURN BYTES ---
+        # Latin-1 encoding works because text is cleaned, or UTF-16 encoded by the Unicode font
+        return pdf.output(dest='S').encode('latin-1', 'replace')
+
+def write_portfolio_report(fh, contracts, title="Portfolio Risk Review", font_path=UNICODE_FONT):
+    """
+    Writes one consolidated report over many contracts to a binary file handle.
+
+    contracts is either a sequence of (filename, risks) pairs or a zero-argument
+    callable returning a fresh iterator of them. It is read twice: once for the
+    summary table of contents and once to render. Pass a callable that streams
+    from disk (see iter_batch_results) to keep memory flat for any number of findings.
+    """
+    source = contracts if callable(contracts) else (lambda: iter(contracts))
+
+    with span("pdf_render_portfolio") as attrs:
+        pdf = StreamingPDFReport(fh, font_path)
+        pdf.set_auto_page_break(auto=True, margin=15)
+        pdf.add_page()
+        font = pdf.body_font
+
+        # --- SUMMARY TABLE OF CONTENTS (clickable rows) ---
+        pdf.set_font(font, 'B', 14)
+        pdf.set_text_color(0)
+        pdf.cell(0, 10, pdf.safe(title), 0, 1)
+        pdf.set_font(font, 'B', 9)
+        pdf.set_fill_color(230, 230, 240)
+        pdf.cell(130, 7, "Contract", 1, 0, 'L', 1)
+        pdf.cell(20, 7, "Critical", 1, 0, 'C', 1)
+        pdf.cell(20, 7, "Warnings", 1, 0, 'C', 1)
+        pdf.cell(20, 7, "Safe", 1, 1, 'C', 1)
+
+        links = []
+        totals = {"High": 0, "Medium": 0, "Low": 0}
+        pdf.set_font(font, '', 9)
+        for filename, risks in source():
+            link = pdf.add_link()
+            links.append(link)
+            counts = {k: len(risks[k]) for k in totals}
+            for k in totals: totals[k] += counts[k]
+            name = pdf.safe(filename)
+            while len(name) > 3 and pdf.get_string_width(name) > 126:
+                name = name[:-4] + "..."
+            pdf.set_text_color(50, 50, 200)
+            pdf.cell(130, 6, name, 1, 0, 'L', 0, link)
+            pdf.set_text_color(0)
+            pdf.cell(20, 6, str(counts["High"]), 1, 0, 'C')
+            pdf.cell(20, 6, str(counts["Medium"]), 1, 0, 'C')
+            pdf.cell(20, 6, str(counts["Low"]), 1, 1, 'C')
+
+        pdf.set_font(font, 'B', 9)
+        pdf.cell(130, 7, f"Total ({len(links)} contracts)", 1, 0, 'L')
+        pdf.cell(20, 7, str(totals["High"]), 1, 0, 'C')
+        pdf.cell(20, 7, str(totals["Medium"]), 1, 0, 'C')
+        pdf.cell(20, 7, str(totals["Low"]), 1, 1, 'C')
+
+        # --- ONE SECTION PER CONTRACT ---
+        for link, (filename, risks) in zip(links, source()):
+            pdf.add_page()
+            pdf.set_link(link)
+            _add_contract(pdf, filename, risks)
+
+        attrs.update(contracts=len(links), findings=sum(totals.values()), pages=pdf.page)
+        pdf.finish()
+
+def iter_batch_results(path):
+    """
+    Streams (filename, risks) pairs from a batch.py JSONL results file.
+    """
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if row.get("status") == "ok":
+                yield row["file"], row["risks"]
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Render one consolidated PDF from batch.py results.")
+    ap.add_argument("results", help="JSONL file written by batch.py")
+    ap.add_argument("-o", "--output", default="LexiSafe_Portfolio_Report.pdf")
+    ap.add_argument("--font", default=UNICODE_FONT, help="TrueType font for full Unicode output")
+    args = ap.parse_args(argv)
+
+    with open(args.output, "wb") as fh:
+        write_portfolio_report(fh, lambda: iter_batch_results(args.results), font_path=args.font)
+    print(f"Report written to {args.output}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
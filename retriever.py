@@ -0,0 +1,98 @@
+import math
+import re
+from collections import Counter
+
+# --- RETRIEVAL CONFIG ---
+PASSAGE_MAX_CHARS = 1200
+PASSAGE_MIN_CHARS = 200
+TOP_K = 5
+
+# BM25 parameters (standard defaults)
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "has", "have", "how", "i", "if", "in", "is", "it", "its", "me", "my", "of", "on",
+    "or", "our", "shall", "that", "the", "their", "there", "this", "to", "was", "we",
+    "what", "when", "where", "which", "who", "will", "with", "you", "your",
+}
+
+def tokenize(text):
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+# Blank lines, or a new line opening with clause numbering ("12.", "4.2)", "Section 3")
+BOUNDARY = re.compile(r"\n\s*\n|\n(?=[ \t]*(?:\d+(?:\.\d+)*[.)][ \t]|(?:section|article|clause)[ \t]+\d))", re.I)
+
+def split_passages(text, max_chars=PASSAGE_MAX_CHARS, min_chars=PASSAGE_MIN_CHARS):
+    """
+    Splits contract text into clause- or paragraph-sized passages with their
+    character offsets. Short pieces (headings, single lines) are merged into the
+    next one and overlong ones are cut at sentence breaks.
+    """
+    spans = []
+    start = 0
+    cuts = [m.start() for m in BOUNDARY.finditer(text)] + [len(text)]
+    for cut in cuts:
+        if cut - start < min_chars and cut != len(text):
+            continue
+        while cut - start > max_chars:
+            stop = text.rfind(". ", start, start + max_chars)
+            stop = stop + 1 if stop > start else start + max_chars
+            spans.append((start, stop))
+            start = stop
+        spans.append((start, cut))
+        start = cut
+
+    passages = []
+    for s, e in spans:
+        chunk = text[s:e]
+        stripped = chunk.strip()
+        if stripped:
+            lead = len(chunk) - len(chunk.lstrip())
+            passages.append({"start": s + lead, "end": s + lead + len(stripped), "text": stripped})
+    return passages
+
+class ContractIndex:
+    """
+    BM25 index over the passages of one contract. Build once per document,
+    then query per chat turn.
+    """
+
+    def __init__(self, text):
+        self.passages = split_passages(text)
+        self.term_freqs = [Counter(tokenize(p["text"])) for p in self.passages]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        df = Counter()
+        for tf in self.term_freqs:
+            df.update(tf.keys())
+        n = len(self.passages)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def search(self, query, k=TOP_K):
+        """
+        Returns up to k passages ranked by BM25 score against the query.
+        """
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        scored = []
+        for i, tf in enumerate(self.term_freqs):
+            score = 0.0
+            norm = K1 * (1 - B + B * self.lengths[i] / self.avg_length) if self.avg_length else K1
+            for t in terms:
+                f = tf.get(t)
+                if f:
+                    score += self.idf[t] * f * (K1 + 1) / (f + norm)
+            if score > 0:
+                scored.append((score, i))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [self.passages[i] for _, i in scored[:k]]
+
+    def context_for(self, query, k=TOP_K):
+        """
+        Prompt-ready excerpts for a question, in document order.
+        Falls back to the opening passages when nothing matches.
+        """
+        hits = self.search(query, k) or self.passages[:k]
+        hits = sorted(hits, key=lambda p: p["start"])
+        return "\n\n".join(f"[Excerpt {n}]\n{p['text']}" for n, p in enumerate(hits, start=1))
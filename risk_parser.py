@@ -0,0 +1,93 @@
+import re
+from metrics import span, inc
+
+RISK_LEVELS = ("High", "Medium", "Low")
+
+def empty_risks():
+    return {"High": [], "Medium": [], "Low": []}
+
+def record_key(record):
+    """
+    Normalised (title, risk) pair used to spot the same finding reported twice.
+    """
+    parts = record.split("|")
+    title = re.sub(r"[^a-z0-9]+", " ", parts[0].lower()).strip()
+    risk = parts[1].strip().lower() if len(parts) > 1 else ""
+    return title, risk
+
+def parse_record(record):
+    """
+    Turns one 'Title | Risk | Explanation | Fix' record into (bucket, item).
+    Returns None when the record does not have at least three fields.
+    """
+    p = record.split("|")
+    if len(p) < 3:
+        return None
+    d = {"title": p[0].strip(), "risk": p[1].strip(), "expl": p[2].strip(), "fix": p[3].strip() if len(p) > 3 else ""}
+    if "High" in d["risk"]: return "High", d
+    if "Medium" in d["risk"]: return "Medium", d
+    return "Low", d
+
+class RiskStreamParser:
+    """
+    Consumes an analysis response chunk by chunk and emits each record as soon
+    as its '###' terminator arrives. Completed findings are bucketed into
+    self.risks; malformed records and error messages are kept, not dropped.
+    """
+
+    def __init__(self, dedupe=True):
+        self.risks = empty_risks()
+        self.malformed = []
+        self.errors = []
+        self.dedupe = dedupe
+        self._seen = set()
+        self._buffer = ""
+
+    def feed(self, chunk):
+        """
+        Adds a piece of the response; returns the (bucket, item) pairs it completed.
+        """
+        self._buffer += chunk
+        *complete, self._buffer = self._buffer.split("###")
+        return self._consume(complete)
+
+    def close(self):
+        """
+        Flushes whatever followed the last terminator.
+        """
+        rest, self._buffer = self._buffer, ""
+        return self._consume([rest])
+
+    def _consume(self, records):
+        out = []
+        for record in records:
+            record = record.strip()
+            if not record or record == "No Content Found":
+                continue
+            if record.startswith("Error:") or record.startswith("Error "):
+                self.errors.append(record)
+                continue
+            parsed = parse_record(record) if "|" in record else None
+            if parsed is None:
+                self.malformed.append(record)
+                inc("records_malformed_total")
+                continue
+            if self.dedupe:
+                key = record_key(record)
+                if key in self._seen:
+                    continue
+                self._seen.add(key)
+            self.risks[parsed[0]].append(parsed[1])
+            inc("records_parsed_total", risk=parsed[0])
+            out.append(parsed)
+        return out
+
+def parse_risks(raw):
+    """
+    Parses a complete analysis response into the High/Medium/Low buckets.
+    """
+    with span("parse", chars=len(raw)):
+        parser = RiskStreamParser(dedupe=False)
+        parser.feed(raw)
+        parser.close()
+    return parser.risks
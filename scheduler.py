@@ -0,0 +1,261 @@
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from metrics import inc, observe, estimate_tokens
+
+# --- QUOTA CONFIG ---
+# Set these a little under the project's Gemini quota
+RPM_LIMIT = int(os.getenv("LEXISAFE_RPM", "60"))
+TPM_LIMIT = int(os.getenv("LEXISAFE_TPM", "1000000"))
+MAX_RETRIES = int(os.getenv("LEXISAFE_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0     # seconds, doubled per attempt
+BACKOFF_CAP = 60.0
+RESPONSE_TOKENS = 1024  # allowance for the reply when estimating a request's cost
+
+# --- TOKEN BUDGETS ---
+# Upper bound on the estimated prompt tokens (template included) of one call, per call site.
+# Analysis windows and clause batches are sized from their budget; for the rest
+# the variable part of the prompt is cut to fit.
+TOKEN_BUDGETS = {
+    "analysis": int(os.getenv("LEXISAFE_ANALYSIS_TOKENS", "5200")),
+    "clause_analysis": int(os.getenv("LEXISAFE_ANALYSIS_TOKENS", "5200")),
+    "chat": int(os.getenv("LEXISAFE_CHAT_TOKENS", "4000")),
+    "chat_summary": int(os.getenv("LEXISAFE_CHAT_TOKENS", "4000")),
+    "email": int(os.getenv("LEXISAFE_EMAIL_TOKENS", "3000")),
+}
+CHARS_PER_TOKEN = 4   # matches metrics.estimate_tokens
+
+# --- PRIORITY LANES (lower runs first) ---
+INTERACTIVE = 0   # chat the user is waiting on
+BULK = 1          # contract analysis
+BACKGROUND = 2    # email drafting
+
+class TokenBucket:
+    """
+    Refills continuously at rate_per_minute up to capacity (one minute's worth).
+    """
+
+    def __init__(self, rate_per_minute, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """
+        Seconds until `amount` can be taken (0 if it can be taken now).
+        """
+        self._refill()
+        amount = min(amount, self.capacity)  # an oversized request waits for a full bucket, not forever
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+# Exception types worth another attempt, by class name so no SDK has to be imported:
+# google.genai's ServerError, LangChain's rate-limit/timeout/connection errors, timeouts
+RETRYABLE_TYPES = {"ServerError", "ModelRateLimitError", "ModelTimeoutError", "ModelConnectionError",
+                   "TimeoutError", "TimeoutException", "ConnectError"}
+# Whole status tokens only: a bare "500" would also match "prompt has 1500 tokens"
+RETRYABLE_TEXT = re.compile(r"\b429\b|\bRESOURCE_EXHAUSTED\b|\bUNAVAILABLE\b|\bDEADLINE_EXCEEDED\b", re.I)
+
+def _status(exc):
+    """
+    (HTTP status, exception carrying it) from exc or its causes: the Gemini
+    client re-raises google.genai errors without a code, chained from the original.
+    """
+    for _ in range(5):
+        if exc is None:
+            break
+        response = getattr(exc, "response", None)
+        code = getattr(exc, "code", None) or getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+        if isinstance(code, int):
+            return code, exc
+        exc = exc.__cause__
+    return None, None
+
+def retry_after(exc):
+    """
+    Seconds to wait before retrying exc, or None if it is not retryable.
+    Retries 429s, 5xx and timeouts; honours a Retry-After header when present.
+    """
+    code, source = _status(exc)
+    if code is not None:
+        if code != 429 and not 500 <= code < 600:
+            return None
+    else:
+        chain, e = [], exc
+        while e is not None and len(chain) < 5:
+            chain.append(e)
+            e = e.__cause__
+        names = {cls.__name__ for e in chain for cls in type(e).__mro__}
+        if not (names & RETRYABLE_TYPES or any(RETRYABLE_TEXT.search(str(e)) for e in chain)):
+            return None
+        source = exc
+    headers = getattr(getattr(source, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After") or 0)
+    except (TypeError, ValueError, AttributeError):
+        return 0.0
+
+class RequestScheduler:
+    """
+    Client-side gate in front of every Gemini call: requests-per-minute and
+    tokens-per-minute buckets, priority lanes, and jittered exponential backoff
+    on 429/5xx. Only the highest-priority waiter may take from the buckets, so
+    an interactive question jumps ahead of queued analysis and email calls.
+    After a 429 the whole gate pauses for the backoff, not just that caller.
+    """
+
+    def __init__(self, rpm=RPM_LIMIT, tpm=TPM_LIMIT, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP, clock=time.monotonic, sleep=time.sleep):
+        self.requests = TokenBucket(rpm, clock)
+        self.tokens = TokenBucket(tpm, clock)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.clock = clock
+        self.sleep = sleep
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def acquire(self, priority=BULK, tokens=1):
+        """
+        Blocks until this request may be sent under both quotas.
+        """
+        started = self.clock()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    if self._waiters[0] == ticket:
+                        wait = max(self.paused_until - self.clock(),
+                                   self.requests.wait_time(1),
+                                   self.tokens.wait_time(tokens))
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            return
+                        self._cond.wait(timeout=wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                observe("scheduler_wait_seconds", self.clock() - started, priority=priority)
+
+    def _backoff(self, attempt, exc):
+        hinted = retry_after(exc)
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        delay = max(delay, hinted or 0.0)
+        with self._cond:
+            self.paused_until = max(self.paused_until, self.clock() + delay)
+            self._cond.notify_all()
+        inc("llm_retries_total", reason=type(exc).__name__)
+        self.sleep(delay)
+
+    def call(self, fn, priority=BULK, tokens=1):
+        """
+        Runs fn() once admitted, retrying retryable failures with backoff.
+        The last error is re-raised when retries run out.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, tokens)
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == self.max_retries or retry_after(e) is None:
+                    raise
+                self._backoff(attempt, e)
+
+    def stream(self, make_stream, priority=BULK, tokens=1):
+        """
+        Like call() for a streaming response: make_stream() returns an iterator.
+        A failure is only retried before the first chunk has been yielded.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, tokens)
+            started = False
+            try:
+                for chunk in make_stream():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or attempt == self.max_retries or retry_after(e) is None:
+                    raise
+                self._backoff(attempt, e)
+
+def request_tokens(inputs, template="", response_tokens=RESPONSE_TOKENS):
+    """
+    Estimated cost of a request: prompt text plus an allowance for the reply.
+    """
+    return estimate_tokens(template + "".join(str(v) for v in inputs.values())) + response_tokens
+
+def budget_chars(call, template=""):
+    """
+    How many characters of variable text fit in one call alongside its template.
+    """
+    return max(TOKEN_BUDGETS[call] - estimate_tokens(template), 1) * CHARS_PER_TOKEN
+
+def fit_budget(call, inputs, template, field, minimum=0):
+    """
+    Counts a call's prompt tokens and, when they exceed the call's budget, cuts
+    inputs[field] at a line or sentence break so the prompt fits. The field is
+    never cut below minimum characters, even if the prompt stays over budget.
+    Returns the (possibly new) inputs dict.
+    """
+    budget = TOKEN_BUDGETS.get(call)
+    over = request_tokens(inputs, template, response_tokens=0) - budget if budget else 0
+    if over <= 0:
+        return inputs
+    text = str(inputs[field])
+    keep = max(len(text) - over * CHARS_PER_TOKEN, minimum, 0)
+    if keep >= len(text):
+        return inputs
+    cut = max(text.rfind("\n", 0, keep), text.rfind(". ", 0, keep) + 1)
+    if cut < keep * 0.8 or cut < minimum:
+        cut = keep
+    inc("token_budget_trimmed_total", call=call)
+    inc("token_budget_trimmed_tokens_total", estimate_tokens(text[cut:]), call=call)
+    return {**inputs, field: text[:cut]}
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """
+    Returns the process-wide scheduler shared by every call site.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+def configure(**kwargs):
+    """
+    Replaces the process-wide scheduler, e.g. to give each worker process its
+    share of the quota. Takes RequestScheduler's keyword arguments.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = RequestScheduler(**kwargs)
+        return _scheduler
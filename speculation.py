@@ -0,0 +1,48 @@
+import threading
+
+class StreamJob:
+    """
+    Runs a text stream on a worker pool ahead of time and keeps every chunk, so
+    a reader can attach at any point: follow() replays what has arrived and then
+    waits for the rest, result() returns the whole text.
+    """
+
+    def __init__(self, pool, make_stream):
+        self._chunks = []
+        self._done = False
+        self.failed = False
+        self._cond = threading.Condition()
+        self.future = pool.submit(self._run, make_stream)
+
+    def _run(self, make_stream):
+        try:
+            for chunk in make_stream():
+                with self._cond:
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self.failed = True
+                self._chunks.append(f"Error: {str(e)}")
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def done(self):
+        return self._done
+
+    def follow(self):
+        seen = 0
+        while True:
+            with self._cond:
+                while seen == len(self._chunks) and not self._done:
+                    self._cond.wait()
+                new, finished = self._chunks[seen:], self._done
+            seen += len(new)
+            yield from new
+            if finished:
+                return
+
+    def result(self):
+        return "".join(self.follow())
@@ -0,0 +1,115 @@
+import pytest
+import utils
+from analysis_cache import AnalysisCache
+from clauses import segment_clauses, clause_hash
+from utils import _clause_batches, _split_clause_response, stream_clause_analysis, analysis_version
+
+CONTRACT = """MASTER SERVICES AGREEMENT
+
+1. Termination
+The Supplier may terminate this Agreement at any time without notice to the Customer.
+
+2. Liability
+The Customer's liability is unlimited, including for indirect and consequential damages.
+
+3. Fees
+All fees are payable within thirty days of the date of the invoice, as set out in Section 2.
+"""
+
+def test_segments_on_numbering_with_offsets_and_headings():
+    clauses = segment_clauses(CONTRACT)
+    assert len(clauses) == 3
+    for clause in clauses:
+        assert CONTRACT[clause["start"]:clause["end"]] == clause["text"]
+    # The title heading is too short to stand alone and joins the first clause
+    assert clauses[0]["text"].startswith("MASTER SERVICES AGREEMENT\n\n1. Termination")
+    assert [c["heading"] for c in clauses] == ["MASTER SERVICES AGREEMENT", "Liability", "Fees"]
+
+def test_overlong_clause_is_cut_at_sentence_breaks():
+    text = "1. " + "The Supplier shall keep records. " * 300
+    clauses = segment_clauses(text, max_chars=1000)
+    assert len(clauses) > 1
+    assert all(len(c["text"]) <= 1000 for c in clauses)
+    assert all(c["text"].rstrip().endswith(".") for c in clauses)
+
+def test_clause_hash_ignores_numbering_case_and_cross_references():
+    a = "4.2 The Supplier may terminate under Section 9 without notice."
+    b = "7.1  the supplier may TERMINATE under section 12 without   notice."
+    assert clause_hash(a) == clause_hash(b)
+    assert clause_hash("Notice period is 30 days.") != clause_hash("Notice period is 90 days.")
+
+def test_batches_respect_character_budget():
+    pending = [(str(i), "x" * 300) for i in range(10)]
+    batches = list(_clause_batches(pending, 1000))
+    assert [item for batch in batches for item in batch] == pending
+    assert all(sum(len(c) + utils.CLAUSE_ID_CHARS for _, c in batch) <= 1000 for batch in batches)
+    # A clause bigger than the budget still gets a batch of its own
+    assert list(_clause_batches([("big", "x" * 5000)], 1000)) == [[("big", "x" * 5000)]]
+
+def test_split_clause_response_by_id():
+    raw = ("C0 | Termination | High | No notice. | Add notice.\n###\n"
+           "[C1] | Liability | High | Unlimited. | Cap it.\n###\n"
+           "1 | Consequential | Medium | Indirect damages. | Exclude them.\n###\n")
+    found, stray = _split_clause_response(raw, 2)
+    assert found == {0: ["Termination | High | No notice. | Add notice."],
+                     1: ["Liability | High | Unlimited. | Cap it.",
+                         "Consequential | Medium | Indirect damages. | Exclude them."]}
+    assert stray == []
+
+def test_split_clause_response_keeps_stray_and_out_of_range_records():
+    raw = ("C0 | Termination | High | No notice. | Add notice.\n###\n"
+           "C5 | Invented | Low | Not in this batch. | -\n###\n"
+           "Liability | High | No id at all. | Cap it.\n###\n"
+           "No Content Found")
+    found, stray = _split_clause_response(raw, 2)
+    assert list(found) == [0]
+    assert stray == ["C5 | Invented | Low | Not in this batch. | -",
+                     "Liability | High | No id at all. | Cap it."]
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    sent = []
+    def invoke(chain, body, template, call):
+        ids = [part.split("]")[0] for part in body.split("[C")[1:]]
+        sent.append(body)
+        return "".join(f"C{i} | Finding {i} | High | Risky. | Fix.\n###\n" for i in ids)
+    monkeypatch.setattr(utils, "_analysis_chain", lambda template: None)
+    monkeypatch.setattr(utils, "_invoke", invoke)
+    return sent
+
+def test_only_unseen_clauses_are_sent(tmp_path, fake_model):
+    cache = AnalysisCache(path=str(tmp_path / "cache.sqlite3"))
+    first = "".join(stream_clause_analysis(CONTRACT, cache=cache, prescreen=False))
+    assert first.count("Finding") == 3 and len(fake_model) == 1
+
+    fake_model.clear()
+    again = "".join(stream_clause_analysis(CONTRACT, cache=cache, prescreen=False))
+    assert fake_model == [] and again.count("Finding") == 3
+
+    edited = CONTRACT.replace("thirty days", "ninety days")
+    "".join(stream_clause_analysis(edited, cache=cache, prescreen=False))
+    assert len(fake_model) == 1
+    assert "ninety days" in fake_model[0] and "without notice" not in fake_model[0]
+
+def test_batch_with_unattributed_findings_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "_analysis_chain", lambda template: None)
+    monkeypatch.setattr(utils, "_invoke", lambda *a, **k: "Liability | High | No id. | Cap it.\n###\n")
+    cache = AnalysisCache(path=str(tmp_path / "cache.sqlite3"))
+    out = "".join(stream_clause_analysis(CONTRACT, cache=cache, prescreen=False))
+    assert "No id." in out
+    hashes = [clause_hash(c["text"]) for c in segment_clauses(CONTRACT)]
+    assert cache.get_clauses(hashes, utils.clause_version(), utils.MODEL_NAME) == {}
+
+def test_analysis_version_tracks_mode_and_prompt(monkeypatch):
+    monkeypatch.setattr(utils, "PRESCREEN_ENABLED", False)
+    monkeypatch.setattr(utils, "CLAUSE_CACHE_ENABLED", True)
+    clause = analysis_version()
+    monkeypatch.setattr(utils, "CLAUSE_PROMPT_VERSION", "test-bump")
+    assert analysis_version() != clause
+    monkeypatch.setattr(utils, "CLAUSE_CACHE_ENABLED", False)
+    window = analysis_version()
+    assert window != clause
+    monkeypatch.setattr(utils, "PROMPT_VERSION", "test-bump")
+    assert analysis_version() != window
+    monkeypatch.setattr(utils, "PRESCREEN_ENABLED", True)
+    assert analysis_version().startswith("window-test-bump+")
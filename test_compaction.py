@@ -0,0 +1,51 @@
+import compaction
+from compaction import compact_pages, compact_text, compaction_version
+from analysis_cache import AnalysisCache
+from doc_store import DocumentStore
+
+def page(n, body):
+    return f"ACME Corp - Confidential\n{body}\nPage {n} of 4\n"
+
+PAGES = [
+    page(1, "Section 3 Termination\nThe Supplier may termi-\nnate   this Agreement."),
+    page(2, "Section 4 Liability\nLiability is capped at fees."),
+    "",
+    page(4, "Section 5 Fees\nFees are due\n\n\n\nwithin thirty days."),
+]
+
+def test_repeated_headers_footers_and_page_numbers_are_removed():
+    stats = {}
+    out = compact_pages(PAGES, stats)
+    assert len(out) == len(PAGES) and out[2] == ""
+    assert not any("Confidential" in p or "Page" in p for p in out)
+    assert [p.split("\n")[0] for p in out if p] == ["Section 3 Termination", "Section 4 Liability", "Section 5 Fees"]
+    assert stats["edge_lines_removed"] == 6
+    assert stats["chars_after"] < stats["chars_before"]
+
+def test_hyphenation_and_whitespace_are_compacted():
+    assert compact_text("may termi-\nnate   this\n\n\n\nAgreement") == "may terminate this\n\nAgreement"
+    # A hyphen before a capital is a real dash, not a line-break split
+    assert compact_text("Non-\nCompete") == "Non-\nCompete"
+
+def test_short_documents_keep_their_first_lines():
+    out = compact_pages([page(1, "Section 1 Scope\nThe services.")])
+    assert out[0].startswith("ACME Corp - Confidential")
+
+def test_compaction_version_tracks_setting_and_rules(monkeypatch):
+    monkeypatch.setattr(compaction, "COMPACT_ENABLED", False)
+    assert compaction_version() == "raw"
+    monkeypatch.setattr(compaction, "COMPACT_ENABLED", True)
+    before = compaction_version()
+    monkeypatch.setattr(compaction, "COMPACT_VERSION", "test-bump")
+    assert compaction_version() not in ("raw", before)
+
+def test_text_caches_are_keyed_by_compaction_version(tmp_path):
+    cache = AnalysisCache(path=str(tmp_path / "cache.sqlite3"))
+    store = DocumentStore(path=str(tmp_path / "docs"))
+    for c in (cache, store):
+        c.put_text("doc", "compact-1", "compacted text")
+        c.put_pages("doc", "compact-1", [0, 8])
+        assert c.get_text("doc", "compact-1") == "compacted text"
+        assert c.get_text("doc", "raw") is None
+        assert c.get_pages("doc", "compact-1") == [0, 8]
+        assert c.get_pages("doc", "compact-2") is None
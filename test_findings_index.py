@@ -0,0 +1,23 @@
+from findings_index import FindingsIndex, fts_query
+
+def _risks(*titles):
+    return {"High": [{"title": t, "expl": f"{t} explained", "fix": f"Fix {t}"} for t in titles], "Medium": [], "Low": []}
+
+def test_duplicate_hash_in_one_batch_is_indexed_once(tmp_path):
+    index = FindingsIndex(str(tmp_path / "findings.sqlite3"))
+    risks = _risks("Uncapped liability", "Data sale")
+    index.add_many([("h1", "a.pdf", risks), ("h1", "sub/b.pdf", risks)])
+    assert index.stats() == {"documents": 1, "findings": 2}
+    hits = index.search("liability")
+    assert len(hits) == 1 and hits[0]["name"] == "sub/b.pdf"
+
+def test_reindexing_replaces_earlier_findings(tmp_path):
+    index = FindingsIndex(str(tmp_path / "findings.sqlite3"))
+    index.add("h1", "a.pdf", _risks("Uncapped liability"))
+    index.add("h1", "a.pdf", _risks("Auto renewal"))
+    assert index.search("liability") == []
+    assert [d["name"] for d in index.documents("renewal")] == ["a.pdf"]
+
+def test_fts_query_quotes_terms_and_splits_on_or():
+    assert fts_query('uncapped liab OR "data" sale') == '("uncapped"* AND "liab"*) OR ("data"* AND "sale"*)'
+    assert fts_query("  ") == ""
@@ -0,0 +1,46 @@
+import pytest
+from prescreen import RuleSet, RULES_PATH, prescreen
+
+RULES = RuleSet.from_file(RULES_PATH)
+
+@pytest.mark.parametrize("sentence, rule_id", [
+    ("The company reserves the right to terminate the account at any time without notice.", "termination-without-notice"),
+    ("The user data will be sold to third-party advertisers for revenue generation.", "sale-of-user-data"),
+    ("We reserve the right to modify these terms at any time.", "unilateral-amendment"),
+    ("Any arbitration shall be conducted outside the Customer's country under ICC rules.", "foreign-arbitration"),
+    ("The Customer accepts unlimited liability for all claims.", "unlimited-liability"),
+    ("The Customer's liability under this Agreement is unlimited.", "unlimited-liability"),
+    ("This Agreement will automatically renew for successive one-year terms.", "auto-renewal"),
+])
+def test_risky_sentence_fires_rule(sentence, rule_id):
+    hits = RULES.match(sentence)
+    assert hits and hits[0]["id"] == rule_id
+
+@pytest.mark.parametrize("sentence", [
+    "The Supplier shall not sell customer data to any third party.",
+    "Neither party may terminate this Agreement without notice.",
+    "This Agreement will not automatically renew.",
+    "In no event shall either party have unlimited liability.",
+    "Customer data is never sold to third parties.",
+    "The Supplier cannot amend these terms at any time without consent.",
+])
+def test_negated_sentence_is_left_to_model(sentence):
+    assert RULES.match(sentence) is None
+    records, remainder = prescreen(sentence, RULES)
+    assert records == ""
+    assert remainder == sentence
+
+def test_qualified_sentence_is_left_to_model():
+    assert RULES.match("This Agreement will automatically renew unless either party objects.") is None
+
+def test_unrelated_sentence_matches_nothing():
+    assert RULES.match("Disputes will be resolved in the courts of Delaware.") == []
+
+def test_prescreen_splits_local_and_model_text():
+    text = ("The user data will be sold to third-party advertisers. "
+            "The Supplier shall not sell customer data to any third party. "
+            "Fees are due within thirty days.")
+    records, remainder = prescreen(text, RULES)
+    assert records.startswith("Sale of User Data | High |")
+    assert "shall not sell" in remainder and "Fees are due" in remainder
+    assert "advertisers" not in remainder
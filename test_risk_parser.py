@@ -0,0 +1,41 @@
+import pytest
+from risk_parser import RiskStreamParser, parse_risks
+
+RESPONSE = (
+    "Termination | High | Ends without notice. | Require 30 days.\n###\n"
+    "Governing Law | Low | Delaware law. | None.\n###\n"
+    "Liability Cap | Medium | Capped at fees. | Raise the cap.\n###\n"
+)
+
+def feed_in_pieces(text, size):
+    parser, emitted = RiskStreamParser(), []
+    for i in range(0, len(text), size):
+        emitted += parser.feed(text[i:i + size])
+    emitted += parser.close()
+    return parser, emitted
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 50, len(RESPONSE)])
+def test_chunk_boundaries_do_not_change_the_result(size):
+    parser, emitted = feed_in_pieces(RESPONSE, size)
+    assert parser.risks == parse_risks(RESPONSE)
+    assert [item["title"] for _, item in emitted] == ["Termination", "Governing Law", "Liability Cap"]
+    assert parser.malformed == [] and parser.errors == []
+
+def test_record_is_emitted_when_its_terminator_arrives():
+    parser = RiskStreamParser()
+    assert parser.feed("Termination | High | Ends without notice. | Require 30 days.\n##") == []
+    done = parser.feed("#\nGoverning Law | Low | Delaw")
+    assert [(bucket, item["title"]) for bucket, item in done] == [("High", "Termination")]
+    assert parser.risks["Low"] == []
+    assert [item["title"] for _, item in parser.close()] == ["Governing Law"]
+
+def test_malformed_records_and_errors_are_kept():
+    parser, _ = feed_in_pieces("just some prose\n###\nError: quota exceeded\n###\n" + RESPONSE, 5)
+    assert parser.malformed == ["just some prose"]
+    assert parser.errors == ["Error: quota exceeded"]
+    assert sum(len(v) for v in parser.risks.values()) == 3
+
+def test_duplicate_findings_across_chunks_are_dropped():
+    parser, emitted = feed_in_pieces(RESPONSE + "termination  | High | Same finding again. | -\n###\n", 4)
+    assert len(emitted) == 3
+    assert len(parser.risks["High"]) == 1
@@ -0,0 +1,131 @@
+import threading
+import time
+import pytest
+from scheduler import (RequestScheduler, retry_after, fit_budget, request_tokens,
+                       TOKEN_BUDGETS, INTERACTIVE, BULK)
+
+TEMPLATE = "Answer from {context}\n{question}"
+
+def test_fit_budget_leaves_small_prompts_alone():
+    inputs = {"context": "Short contract.", "question": "Is it fine?"}
+    assert fit_budget("chat", inputs, TEMPLATE, "context") is inputs
+
+def test_fit_budget_cuts_field_to_budget_at_a_break():
+    inputs = {"context": "The Supplier may terminate.\n" * 4000, "question": "Can they terminate?"}
+    fitted = fit_budget("chat", inputs, TEMPLATE, "context")
+    assert request_tokens(fitted, TEMPLATE, response_tokens=0) <= TOKEN_BUDGETS["chat"]
+    assert fitted["context"].endswith("terminate.")
+    assert fitted["question"] == inputs["question"]
+
+def test_fit_budget_keeps_minimum_of_field():
+    inputs = {"context": "x" * 8000, "question": "q" * TOKEN_BUDGETS["chat"] * 4}
+    fitted = fit_budget("chat", inputs, TEMPLATE, "context", minimum=6000)
+    assert len(fitted["context"]) == 6000
+    small = {"context": "x" * 5000, "question": inputs["question"]}
+    assert fit_budget("chat", small, TEMPLATE, "context", minimum=6000) is small
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class StatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+def make_scheduler(clock, rpm=600, max_retries=3):
+    return RequestScheduler(rpm=rpm, tpm=10**6, max_retries=max_retries, clock=clock, sleep=clock.sleep)
+
+def flaky(*failures):
+    calls = []
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return "ok"
+    return fn, calls
+
+@pytest.mark.parametrize("code", [429, 500, 503])
+def test_call_retries_rate_limits_and_server_errors(code):
+    clock = FakeClock()
+    fn, calls = flaky(StatusError(code), StatusError(code))
+    assert make_scheduler(clock).call(fn) == "ok"
+    assert len(calls) == 3
+
+def test_call_does_not_retry_client_errors():
+    fn, calls = flaky(StatusError(400))
+    with pytest.raises(StatusError):
+        make_scheduler(FakeClock()).call(fn)
+    assert len(calls) == 1
+
+def test_call_reraises_when_retries_run_out():
+    fn, calls = flaky(*[StatusError(429)] * 5)
+    with pytest.raises(StatusError):
+        make_scheduler(FakeClock(), max_retries=2).call(fn)
+    assert len(calls) == 3
+
+def test_token_count_in_message_is_not_a_status():
+    assert retry_after(ValueError("prompt has 1500 tokens")) is None
+    fn, calls = flaky(ValueError("prompt has 1500 tokens"))
+    with pytest.raises(ValueError):
+        make_scheduler(FakeClock()).call(fn)
+    assert len(calls) == 1
+
+def test_retry_after_reads_status_from_cause_and_header():
+    class Response:
+        status_code = 429
+        headers = {"Retry-After": "7"}
+    class ClientError(Exception):
+        response = Response()
+    try:
+        try:
+            raise ClientError("quota")
+        except ClientError as e:
+            raise RuntimeError("Gemini call failed") from e
+    except RuntimeError as wrapped:
+        assert retry_after(wrapped) == 7.0
+    assert retry_after(TimeoutError()) == 0.0
+    assert retry_after(RuntimeError("503 UNAVAILABLE")) == 0.0
+
+def test_backoff_honours_retry_after_hint():
+    class Response:
+        status_code = 429
+        headers = {"retry-after": "30"}
+    class ClientError(Exception):
+        response = Response()
+    clock = FakeClock()
+    fn, _ = flaky(ClientError("quota"))
+    make_scheduler(clock).call(fn)
+    assert clock.now >= 30
+
+def test_interactive_lane_goes_before_queued_bulk():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rpm=1)
+    scheduler.acquire(BULK)          # empties the one-request bucket
+    order = []
+    def waiter(priority, name):
+        scheduler.acquire(priority)
+        order.append(name)
+    threads = [threading.Thread(target=waiter, args=(BULK, "bulk"))]
+    threads[0].start()
+    while len(scheduler._waiters) < 1:
+        time.sleep(0.001)
+    threads.append(threading.Thread(target=waiter, args=(INTERACTIVE, "chat")))
+    threads[1].start()
+    while len(scheduler._waiters) < 2:
+        time.sleep(0.001)
+    for expected in (1, 2):
+        clock.now += 60              # refills one request
+        with scheduler._cond:
+            scheduler._cond.notify_all()
+        while len(order) < expected:
+            time.sleep(0.001)
+    for t in threads:
+        t.join(timeout=1)
+    assert order == ["chat", "bulk"]
@@ -0,0 +1,76 @@
+import itertools
+import pytest
+import utils
+from analysis_cache import AnalysisCache
+from utils import stream_clause_analysis, cached_clause_findings
+from versions import version_snapshot, version_changes, diff_clauses, compare_findings
+from risk_parser import parse_risks
+
+V1 = """1. Termination
+The Supplier may terminate this Agreement at any time without notice to the Customer.
+
+2. Liability
+The Customer's liability is unlimited, including for indirect and consequential damages.
+
+3. Fees
+All fees are payable within thirty days of the date of the invoice.
+"""
+V2 = V1.replace("without notice to the Customer", "on ninety days' written notice to the Customer")
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    sent, calls = [], itertools.count(1)
+    def invoke(chain, body, template, call):
+        sent.append(body)
+        n = next(calls)
+        ids = [part.split("]")[0] for part in body.split("[C")[1:]]
+        return "".join(f"C{i} | Finding {n}.{i} | High | Risky. | Fix.\n###\n" for i in ids)
+    monkeypatch.setattr(utils, "_analysis_chain", lambda template: None)
+    monkeypatch.setattr(utils, "_invoke", invoke)
+    return sent
+
+def analyze(text, cache, carried=None):
+    findings = {}
+    raw = "".join(stream_clause_analysis(text, cache=cache, prescreen=False, carried=carried, findings=findings))
+    return parse_risks(raw), findings
+
+def test_diff_clauses_counts():
+    assert diff_clauses(list("abcd"), list("abXdE")) == {"unchanged": 3, "changed": 1, "inserted": 1, "removed": 0}
+    assert diff_clauses(list("abc"), list("ac")) == {"unchanged": 2, "changed": 0, "inserted": 0, "removed": 1}
+
+def test_compare_findings():
+    old = {"High": [{"title": "Termination"}], "Medium": [{"title": "Fees"}], "Low": []}
+    new = {"High": [{"title": "Fees"}], "Medium": [], "Low": [{"title": "Audit"}]}
+    changes = compare_findings(old, new)
+    assert changes["added"] == [("Low", {"title": "Audit"})]
+    assert changes["resolved"] == [("High", {"title": "Termination"})]
+    assert changes["changed"] == [("Medium", "High", {"title": "Fees"})]
+
+def test_redline_only_sends_changed_clause(tmp_path, fake_model):
+    cache = AnalysisCache(path=str(tmp_path / "cache.sqlite3"))
+    risks, findings = analyze(V1, cache)
+    base = version_snapshot("v1.pdf", V1, risks, findings)
+
+    fake_model.clear()
+    # A fresh cache: the carried findings alone must cover the unchanged clauses
+    other = AnalysisCache(path=str(tmp_path / "other.sqlite3"))
+    new_risks, new_findings = analyze(V2, other, carried=base["findings"])
+    assert len(fake_model) == 1 and "ninety days" in fake_model[0] and "Liability" not in fake_model[0]
+    changes = version_changes(base, version_snapshot("v2.pdf", V2, new_risks, new_findings))
+    assert changes["clauses"] == {"unchanged": 2, "changed": 1, "inserted": 0, "removed": 0}
+    assert [item["title"] for _, item in changes["added"]] == ["Finding 2.0"]
+    assert [item["title"] for _, item in changes["resolved"]] == ["Finding 1.0"]
+
+def test_cache_hit_snapshot_carries_clause_findings(tmp_path, fake_model):
+    cache = AnalysisCache(path=str(tmp_path / "cache.sqlite3"))
+    risks, findings = analyze(V1, cache)
+
+    # A later session gets the risks from the document cache and never runs the
+    # clause analysis; its snapshot must still hold the per-clause findings
+    carried = cached_clause_findings(V1, cache=cache)
+    assert carried == findings
+    base = version_snapshot("v1.pdf", V1, risks, carried)
+
+    fake_model.clear()
+    analyze(V2, AnalysisCache(path=str(tmp_path / "other.sqlite3")), carried=base["findings"])
+    assert len(fake_model) == 1 and "Liability" not in fake_model[0]
@@ -1,39 +1,49 @@
 import os
-from dotenv import load_dotenv
-from pypdf import PdfReader
-from langchain_google_genai import ChatGoogleGenerativeAI
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from pdf_extract import extract_pdf_pages, join_pages
+from risk_parser import record_key
+from metrics import span, LLMMetrics
+from llm_clients import get_llm, DEFAULT_MODEL
+from scheduler import get_scheduler, request_tokens, fit_budget, budget_chars, BULK
+from compaction import compact_pages, COMPACT_ENABLED
+from prescreen import prescreen as prescreen_text, get_rules, PRESCREEN_ENABLED
+from clauses import segment_clauses, clause_hash
+from analysis_cache import get_cache
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-load_dotenv()
-
 # --- MODEL (Fixed Name) ---
-llm = ChatGoogleGenerativeAI(
-    model="gemini-flash-latest",
-    api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.1
-)
+MODEL_NAME = DEFAULT_MODEL
+TEMPERATURE = 0.1
 
-def get_pdf_text(uploaded_file):
-    """
-    Extracts text from a single PDF file using pypdf.
-    """
-    try:
-        pdf_reader = PdfReader(uploaded_file)
-        text = ""
-        for page in pdf_reader.pages:
-            content = page.extract_text()
-            if content:
-                text += content + "\n"
-        return text
-    except Exception as e:
-        return f"Error reading PDF: {e}"
+# Bump whenever ANALYSIS_TEMPLATE changes so cached analyses are not reused
+PROMPT_VERSION = "1"
 
-def analyze_clause_with_llm(clause_text):
+def analysis_version():
     """
-    Analyzes the contract text using Gemini.
+    Cache version for document risks: the analysis mode and the version of the
+    prompt it uses (clause batches or whole-document windows), plus the rule
+    set fingerprint when the local pre-screen contributes findings.
     """
-    template = """
+    if CLAUSE_CACHE_ENABLED:
+        version = f"clause-{CLAUSE_PROMPT_VERSION}"
+    else:
+        version = f"window-{PROMPT_VERSION}"
+    return f"{version}+{get_rules().fingerprint}" if PRESCREEN_ENABLED else version
+
+# Process-wide cap on analysis requests in flight (None = unlimited).
+# Batch runs set this so many documents in parallel don't multiply the load.
+_inflight = None
+
+def set_inflight_limit(limit):
+    global _inflight
+    _inflight = threading.BoundedSemaphore(limit) if limit else None
+
+ANALYSIS_TEMPLATE = """
     You are an expert legal AI. Analyze the following contract text and identify risks.
     
     Output format must be strictly:
@@ -49,16 +59,402 @@ def analyze_clause_with_llm(clause_text):
     Contract Text:
     {text}
     """
+
+CLAUSE_TEMPLATE = """
+    You are an expert legal AI. Analyze the following numbered contract clauses and identify risks.
+    Each clause starts with its id in square brackets, e.g. [C3].
     
+    Output format must be strictly:
+    Clause ID | Clause Title | Risk Level (High/Medium/Low) | Brief Explanation | Recommendation/Fix
+    ###
+    
+    Rules:
+    1. Separate each risk with "###".
+    2. Use "|" as a delimiter.
+    3. Start every risk with the id of the clause it comes from, e.g. C3.
+    4. Be concise. Clauses without risks need no output.
+    
+    Clauses:
+    {text}
+    """
+
+# "C3", "[C3]" or a bare "3" in the first field of a clause record
+CLAUSE_ID = re.compile(r"\s*\[?C?(\d+)\]?\s*", re.I)
+
+# --- CHUNKING CONFIG ---
+# Windows are sized to the analysis token budget (scheduler.TOKEN_BUDGETS); the overlap
+# means a clause cut at a boundary is still seen whole by one of the two neighbouring windows.
+CHUNK_SIZE = budget_chars("analysis", ANALYSIS_TEMPLATE)
+CHUNK_OVERLAP = 1500
+MAX_WORKERS = 16
+
+# --- CLAUSE CACHE CONFIG ---
+# Whole contracts are split into clauses and only clauses never seen before, in
+# any document, go to the model; LEXISAFE_CLAUSE_CACHE=off restores plain windows.
+CLAUSE_CACHE_ENABLED = os.getenv("LEXISAFE_CLAUSE_CACHE", "on").lower() not in ("0", "off", "false", "no")
+CLAUSE_BATCH_CHARS = budget_chars("clause_analysis", CLAUSE_TEMPLATE)
+CLAUSE_ID_CHARS = 8   # the "[C12]\n\n" in front of each clause in a batch
+CLAUSE_PROMPT_VERSION = "1"
+
+def get_pdf_text_with_pages(uploaded_file, workers=None, stats=None):
+    """
+    Extracts text plus page offsets, so later stages can point back to pages.
+    Pages are compacted first (see compaction.py); pass a stats dict to get the
+    tokens saved. Returns (text, offsets); see pdf_extract.join_pages.
+    """
+    try:
+        with span("pdf_extract") as attrs:
+            pages = extract_pdf_pages(uploaded_file, workers=workers)
+            attrs["pages"] = len(pages)
+            if COMPACT_ENABLED:
+                stats = {} if stats is None else stats
+                pages = compact_pages(pages, stats)
+                attrs["tokens_saved"] = stats["tokens_saved"]
+            return join_pages(pages)
+    except Exception as e:
+        return f"Error reading PDF: {e}", []
+
+def get_pdf_text(uploaded_file, workers=None, stats=None):
+    """
+    Extracts text from a single PDF file using pypdf.
+    """
+    return get_pdf_text_with_pages(uploaded_file, workers=workers, stats=stats)[0]
+
+def split_into_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Splits text into overlapping windows that together cover all of it.
+    Window ends are pulled back to a paragraph or sentence break when one is near.
+    """
+    if len(text) <= chunk_size:
+        return [text]
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Only look back over the last fifth of the window for a clean break
+            floor = start + int(chunk_size * 0.8)
+            for sep in ("\n\n", "\n", ". "):
+                cut = text.rfind(sep, floor, end)
+                if cut != -1:
+                    end = cut + len(sep)
+                    break
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def merge_risk_outputs(responses):
+    """
+    Merges raw per-chunk responses into a single '###'-separated response,
+    keeping the first occurrence of each finding in document order.
+    """
+    seen = set()
+    records = []
+    for raw in responses:
+        for record in raw.split("###"):
+            record = record.strip()
+            if "|" not in record:
+                continue
+            key = record_key(record)
+            if key in seen:
+                continue
+            seen.add(key)
+            records.append(record)
+    return "\n###\n".join(records)
+
+def _metrics_config(call="analysis"):
+    return {"callbacks": [LLMMetrics(call, MODEL_NAME, TEMPERATURE)]}
+
+def _analysis_chain(template=ANALYSIS_TEMPLATE):
     prompt = PromptTemplate(
         input_variables=["text"],
         template=template
     )
-    
-    chain = prompt | llm | StrOutputParser()
-    
-    try:
-        response = chain.invoke({"text": clause_text})
+    return prompt | get_llm(MODEL_NAME, TEMPERATURE) | StrOutputParser()
+
+def _invoke(chain, text, template=ANALYSIS_TEMPLATE, call="analysis"):
+    inputs = fit_budget(call, {"text": text}, template, "text")
+    with _inflight or nullcontext():
+        return get_scheduler().call(
+            lambda: chain.invoke(inputs, config=_metrics_config(call)),
+            priority=BULK, tokens=request_tokens(inputs, template))
+
+def _stream(chain, text):
+    inputs = fit_budget("analysis", {"text": text}, ANALYSIS_TEMPLATE, "text")
+    return get_scheduler().stream(
+        lambda: chain.stream(inputs, config=_metrics_config()),
+        priority=BULK, tokens=request_tokens(inputs, ANALYSIS_TEMPLATE))
+
+def analyze_clause_with_llm(clause_text, chunked=False, chunk_size=CHUNK_SIZE,
+                            overlap=CHUNK_OVERLAP, max_workers=MAX_WORKERS, prescreen=PRESCREEN_ENABLED):
+    """
+    Analyzes the contract text using Gemini.
+    With chunked=True long documents are split into overlapping windows that are
+    analyzed concurrently and merged, so the whole text is covered.
+    With prescreen=True sentences matching a known clause rule are classified
+    locally (see prescreen.py) and only the rest of the text is sent.
+    """
+    local = ""
+    if prescreen:
+        local, clause_text = prescreen_text(clause_text)
+        if local and not clause_text:
+            return local
+
+    response = _analyze_remote(clause_text, chunked, chunk_size, overlap, max_workers)
+    if not local or response.startswith("Error:"):
         return response
+    return merge_risk_outputs([local, response])
+
+def _analyze_remote(clause_text, chunked, chunk_size, overlap, max_workers):
+    try:
+        chain = _analysis_chain()
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+    def run(text):
+        try:
+            return _invoke(chain, text)
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    if not chunked:
+        return run(clause_text)
+
+    chunks = split_into_chunks(clause_text, chunk_size, overlap)
+    if len(chunks) == 1:
+        return run(chunks[0])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+        responses = list(pool.map(run, chunks))
+
+    ok = [r for r in responses if not r.startswith("Error:")]
+    if not ok:
+        return responses[0]
+    return merge_risk_outputs(ok)
+
+def stream_analysis(clause_text, chunked=False, chunk_size=CHUNK_SIZE,
+                    overlap=CHUNK_OVERLAP, max_workers=MAX_WORKERS, prescreen=PRESCREEN_ENABLED):
+    """
+    Streaming variant of analyze_clause_with_llm: yields the response as text
+    chunks for a risk_parser.RiskStreamParser to consume.
+    A single window streams token by token. With several windows each worker
+    only forwards whole '###'-terminated records, so output from concurrent
+    windows never interleaves mid-record.
+    Pre-screened findings are yielded first, before any model output.
+    """
+    if prescreen:
+        local, clause_text = prescreen_text(clause_text)
+        if local:
+            yield local + "\n###\n"
+            if not clause_text:
+                return
+
+    try:
+        chain = _analysis_chain()
+    except Exception as e:
+        yield f"\n###\nError: {str(e)}\n###\n"
+        return
+    chunks = split_into_chunks(clause_text, chunk_size, overlap) if chunked else [clause_text]
+
+    if len(chunks) == 1:
+        try:
+            with _inflight or nullcontext():
+                for piece in _stream(chain, chunks[0]):
+                    yield piece
+        except Exception as e:
+            yield f"\n###\nError: {str(e)}\n###\n"
+        return
+
+    out = queue.Queue()
+    pending = iter(chunks)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                text = next(pending, None)
+            if text is None:
+                out.put(None)
+                return
+            buffer = ""
+            try:
+                with _inflight or nullcontext():
+                    for piece in _stream(chain, text):
+                        buffer += piece
+                        cut = buffer.rfind("###")
+                        if cut != -1:
+                            out.put(buffer[:cut + 3] + "\n")
+                            buffer = buffer[cut + 3:]
+                out.put(buffer + "\n###\n")
+            except Exception as e:
+                out.put(f"{buffer}\n###\nError: {str(e)}\n###\n")
+
+    workers = min(max_workers, len(chunks))
+    for _ in range(workers):
+        threading.Thread(target=worker, daemon=True).start()
+
+    finished = 0
+    while finished < workers:
+        piece = out.get()
+        if piece is None:
+            finished += 1
+        else:
+            yield piece
+
+def clause_version():
+    """
+    Cache version for clause findings, shared by every document.
+    """
+    return f"{CLAUSE_PROMPT_VERSION}+{get_rules().fingerprint}" if PRESCREEN_ENABLED else CLAUSE_PROMPT_VERSION
+
+def _clause_batches(pending, batch_chars):
+    batch, size = [], 0
+    for item in pending:
+        if batch and size + len(item[1]) + CLAUSE_ID_CHARS > batch_chars:
+            yield batch
+            batch, size = [], 0
+        batch.append(item)
+        size += len(item[1]) + CLAUSE_ID_CHARS
+    if batch:
+        yield batch
+
+def _split_clause_response(raw, count):
+    """
+    Splits a CLAUSE_TEMPLATE response into per-clause findings.
+    Returns ({position: records}, unattributed records).
+    """
+    found, stray = {}, []
+    for record in raw.split("###"):
+        record = record.strip()
+        if "|" not in record:
+            continue
+        first, rest = record.split("|", 1)
+        m = CLAUSE_ID.fullmatch(first)
+        if m and int(m.group(1)) < count:
+            found.setdefault(int(m.group(1)), []).append(rest.strip())
+        else:
+            stray.append(record)
+    return found, stray
+
+def stream_clause_analysis(text, cache=None, batch_chars=CLAUSE_BATCH_CHARS,
+                           max_workers=MAX_WORKERS, prescreen=PRESCREEN_ENABLED,
+                           carried=None, findings=None):
+    """
+    Clause-level analysis with findings cached across documents.
+
+    The text is split into clauses (see clauses.py). Findings of clauses already
+    seen in any document come from the cache; the rest are pre-screened, then
+    sent in batches of up to batch_chars with their ids so each finding can be
+    stored against its clause. Yields '###'-separated records in the same form
+    as stream_analysis: cached findings first, then each batch as it completes.
+
+    carried maps clause hash to findings known from a previous version of the
+    contract (see versions.py); those clauses are neither looked up nor re-sent.
+    When a findings dict is given it is filled with the findings of every
+    clause resolved, ready to be carried into the next version.
+    """
+    cache = cache or get_cache()
+    version = clause_version()
+
+    unique = {}
+    for clause in segment_clauses(text):
+        unique.setdefault(clause_hash(clause["text"]), clause["text"])
+
+    carried = carried or {}
+    known = {h: carried[h] for h in unique if h in carried}
+    with span("clause_lookup", clauses=len(unique), carried=len(known)) as attrs:
+        known.update(cache.get_clauses([h for h in unique if h not in known], version, MODEL_NAME))
+        attrs["hits"] = len(known)
+    if findings is not None:
+        findings.update(known)
+    for h in unique:
+        if known.get(h):
+            yield known[h] + "\n###\n"
+
+    pending, local = [], {}
+    for h, clause in unique.items():
+        if h in known:
+            continue
+        found, rest = prescreen_text(clause) if prescreen else ("", clause)
+        local[h] = found
+        if rest:
+            pending.append((h, rest))
+        elif found:
+            yield found + "\n###\n"
+    sent = {h for h, _ in pending}
+    resolved = {h: found for h, found in local.items() if h not in sent}
+
+    def store():
+        cache.put_clauses(resolved, version, MODEL_NAME)
+        if findings is not None:
+            findings.update(resolved)
+
+    if not pending:
+        store()
+        return
+
+    try:
+        chain = _analysis_chain(CLAUSE_TEMPLATE)
     except Exception as e:
-        return f"Error: {str(e)}"
\ No newline at end of file
+        store()
+        yield f"\n###\nError: {str(e)}\n###\n"
+        return
+
+    def run(batch):
+        body = "\n\n".join(f"[C{i}]\n{clause}" for i, (_, clause) in enumerate(batch))
+        return _invoke(chain, body, CLAUSE_TEMPLATE, call="clause_analysis")
+
+    batches = list(_clause_batches(pending, batch_chars))
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        futures = {pool.submit(run, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                raw = future.result()
+            except Exception as e:
+                yield f"\n###\nError: {str(e)}\n###\n"
+                continue
+            found, stray = _split_clause_response(raw, len(batch))
+            out = []
+            for i, (h, _) in enumerate(batch):
+                records = [local[h]] if local[h] else []
+                records += found.get(i, [])
+                out += records
+                # Without ids some findings can't be tied to a clause, so nothing from this batch is stored
+                if not stray:
+                    resolved[h] = "\n###\n".join(records)
+            out += stray
+            if out:
+                yield "\n###\n".join(out) + "\n###\n"
+    store()
+
+def cached_clause_findings(text, cache=None):
+    """
+    {clause hash: findings} for the clauses of text already in the clause cache,
+    so a document whose risks came from the document cache still has per-clause
+    findings to carry into its next version.
+    """
+    cache = cache or get_cache()
+    hashes = list(dict.fromkeys(clause_hash(c["text"]) for c in segment_clauses(text)))
+    return cache.get_clauses(hashes, clause_version(), MODEL_NAME)
+
+def stream_contract_analysis(text, carried=None, findings=None):
+    """
+    Entry point for whole contracts: clause-level with the cross-document cache
+    when CLAUSE_CACHE_ENABLED, otherwise overlapping windows via stream_analysis.
+    Re-analysis of a new version (carried findings given) is always clause-level,
+    but only findings stored per clause can be carried: with the clause cache
+    off, the first version is windowed and its successor is analyzed in full.
+    """
+    if CLAUSE_CACHE_ENABLED or carried is not None:
+        return stream_clause_analysis(text, carried=carried, findings=findings)
+    return stream_analysis(text, chunked=True)
+
+def analyze_contract(text):
+    """
+    Non-streaming stream_contract_analysis: the whole raw response as one string.
+    """
+    return "".join(stream_contract_analysis(text))
@@ -0,0 +1,62 @@
+from difflib import SequenceMatcher
+from clauses import segment_clauses, clause_hash
+from risk_parser import record_key
+
+def version_snapshot(name, text, risks, findings=None):
+    """
+    What is kept of an analyzed contract so a later version can be compared with it:
+    the clause hashes in document order, the findings per clause hash (as raw
+    records; only clauses analyzed clause by clause have them) and the risks.
+    """
+    return {
+        "name": name,
+        "clauses": [clause_hash(c["text"]) for c in segment_clauses(text)],
+        "findings": dict(findings or {}),
+        "risks": risks,
+    }
+
+def diff_clauses(old_hashes, new_hashes):
+    """
+    Clause-level diff of two versions: counts of unchanged, changed, inserted and removed clauses.
+    """
+    counts = {"unchanged": 0, "changed": 0, "inserted": 0, "removed": 0}
+    matcher = SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        old, new = i2 - i1, j2 - j1
+        if op == "equal":
+            counts["unchanged"] += new
+        elif op == "replace":
+            counts["changed"] += min(old, new)
+            counts["inserted"] += max(new - old, 0)
+            counts["removed"] += max(old - new, 0)
+        elif op == "insert":
+            counts["inserted"] += new
+        else:
+            counts["removed"] += old
+    return counts
+
+def _by_title(risks):
+    return {record_key(item["title"])[0]: (bucket, item) for bucket, items in risks.items() for item in items}
+
+def compare_findings(old_risks, new_risks):
+    """
+    Findings added in the new version, resolved since the old one, and changed
+    (same title, different risk level) as lists of (bucket, item); changed
+    entries are (old bucket, new bucket, item).
+    """
+    old, new = _by_title(old_risks), _by_title(new_risks)
+    return {
+        "added": [new[k] for k in new if k not in old],
+        "resolved": [old[k] for k in old if k not in new],
+        "changed": [(old[k][0], new[k][0], new[k][1]) for k in new if k in old and old[k][0] != new[k][0]],
+    }
+
+def version_changes(base, snapshot):
+    """
+    Everything the dashboard shows about a redline against its previous version.
+    """
+    return {
+        "base": base["name"],
+        "clauses": diff_clauses(base["clauses"], snapshot["clauses"]),
+        **compare_findings(base["risks"], snapshot["risks"]),
+    }